@@ -2,555 +2,1090 @@
 import os
 import sys
 import time
-from crontab import CronTab
+import argparse
 import socket
-from billing import Environment
 import datetime
 
+# crontab, billing and numpy (through cron_load, cron_missed, cron_manifest
+# and cron_simulate) are slow to import, so they are imported by the commands
+# that use them.
+import cron_apply
+import cron_backup
+import cron_daemon
+import cron_dispatch
+import cron_env
+import cron_fleet
+import cron_logindex
+import cron_runs
+import cron_timing
+import cron_walkthrough
+from cron_jobs import (TITLE_RE, bin_dir, build_command, dispatch_command, dispatch_title, is_dispatched,
+                       ksh_from_command, log_dir, make_title, parse_crontab, script_from_command)
+from cron_schedule import compile_schedule, job_expression
+from cron_timing import phase
+
+PREVIEW_RUNS = 5
+OUTPUT_PROFILES = ('instant', 'typewriter', 'quiet')
+output_profile = 'instant'
+ANALYZE_LABELS = 20
+FORECAST_WINDOWS = 3
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Add cron jobs to the rbmuser crontab.')
+    parser.add_argument('--output', choices=OUTPUT_PROFILES,
+                        default=os.environ.get('CRON_AUTOMATION_OUTPUT', 'instant'),
+                        help='how the walk-through prints (default: $CRON_AUTOMATION_OUTPUT or instant)')
+    parser.add_argument('--record-runs', action='store_true',
+                        help="run new jobs through cron_runner.py to record their runtime and exit code")
+    parser.add_argument('--replay', metavar='FILE',
+                        help="take the walk-through's answers from FILE ('-' for stdin), one per line, adding a job "
+                             'for each set of answers')
+    parser.add_argument('--record', metavar='FILE', help="append the walk-through's answers to FILE to replay later")
+    parser.add_argument('--timings', action='store_true',
+                        help='print how long each phase took (always appended to ' + cron_timing.DEFAULT_LOG + ')')
+    parser.add_argument('--metrics-textfile', metavar='PATH', default=cron_timing.DEFAULT_TEXTFILE,
+                        help='also write phase timings here for the node_exporter textfile collector '
+                             '(default: $CRON_AUTOMATION_TEXTFILE)')
+    subparsers = parser.add_subparsers(dest='command')
+
+    manifest = subparsers.add_parser('manifest', help='add every job in a YAML/CSV/JSON manifest in one crontab write')
+    manifest.add_argument('path', help='manifest file with title, directory, ksh and schedule for each job')
+    manifest.add_argument('--dry-run', action='store_true', help='validate the manifest without writing the crontab')
+
+    preview = subparsers.add_parser('preview', help='show when a cron schedule will fire')
+    preview.add_argument('schedule', help='cron schedule, e.g. "0 5 * * 1-5" (quote it)')
+    preview.add_argument('-n', '--count', type=int, default=10, help='number of upcoming runs to show')
+    preview.add_argument('--start', type=parse_date, help='list every run from this date (YYYYMMDD)')
+    preview.add_argument('--end', type=parse_date, help='list every run before this date (YYYYMMDD)')
+
+    analyze = subparsers.add_parser('analyze', help='find the minutes where the most jobs start at once')
+    analyze.add_argument('--month', action='store_true', help='analyze a whole month instead of a week')
+    analyze.add_argument('--date', type=parse_date, help='analyze the week/month containing this date (YYYYMMDD)')
+    analyze.add_argument('--top', type=int, default=10, help='number of peak minutes to report')
+
+    history = subparsers.add_parser('history', help='list crontab backups and what changed in each')
+    history.add_argument('--limit', type=int, default=30, help='show only the newest LIMIT backups')
+    history.add_argument('--job', help='only show backups where the job with this title changed')
+
+    diff = subparsers.add_parser('diff', help='show the jobs that differ between two backups')
+    diff.add_argument('old', help='backup number from history, digest prefix or YYYYMMDD[HHMM] time')
+    diff.add_argument('new', nargs='?', default='current', help="backup to compare with (default: the live crontab)")
+
+    restore = subparsers.add_parser('restore', help='put a backed up crontab back in place')
+    restore.add_argument('backup', help='backup number from history, digest prefix or YYYYMMDD[HHMM] time')
+    restore.add_argument('--yes', action='store_true', help="don't ask for confirmation")
+
+    overlaps = subparsers.add_parser('overlaps', help='count runs skipped, queued or killed because the last run was still going')
+    overlaps.add_argument('--days', type=int, default=30, help='look back this many days')
+
+    logs = subparsers.add_parser('logs', help='index the job logs and show when each job ran')
+    logs.add_argument('ksh', nargs='?', help='show every logged day for this ksh name (without .ksh)')
+    logs.add_argument('--host', help='only logs written on this host')
+    logs.add_argument('--index', default=cron_logindex.DEFAULT_INDEX, help='log index file')
+
+    missed = subparsers.add_parser('missed', help='find days a job should have run but left no log, and the reverse')
+    missed.add_argument('--days', type=int, default=30, help='check this many days up to yesterday')
+    missed.add_argument('--start', type=parse_date, help='first day to check (YYYYMMDD)')
+    missed.add_argument('--end', type=parse_date, help='last day to check (YYYYMMDD)')
+    missed.add_argument('--host', default=socket.gethostname().split('.')[0], help='host whose logs to check')
+    missed.add_argument('--index', default=cron_logindex.DEFAULT_INDEX, help='log index file')
+
+    fleet = subparsers.add_parser('fleet', help='add the jobs in a manifest to many hosts at once')
+    fleet.add_argument('path', help='manifest file with title, directory, ksh and schedule for each job')
+    hosts = fleet.add_mutually_exclusive_group(required=True)
+    hosts.add_argument('--hosts', help='comma separated hosts to update')
+    hosts.add_argument('--env', choices=sorted(set(cron_env.ENVIRONMENTS.values())),
+                       help='update every host of this environment in --hosts-file')
+    fleet.add_argument('--hosts-file', default=cron_fleet.DEFAULT_HOSTS_FILE, help='one hostname per line')
+    fleet.add_argument('--workers', type=int, default=cron_fleet.DEFAULT_WORKERS, help='hosts to update at once')
+    fleet.add_argument('--local', metavar='DIR',
+                       help='update DIR/<host>/<user>.crontab files instead of the hosts (for trying a rollout)')
+    fleet.add_argument('--runner', metavar='COMMAND',
+                       help='how the hosts run cron_runner.py, e.g. "/usr/bin/python3 /opt/cron_automation/cron_runner.py" '
+                            '(needed for --record-runs and rows with an overlap policy)')
+    fleet.add_argument('--dry-run', action='store_true', help='show what would be added without writing any crontab')
+
+    selection = argparse.ArgumentParser(add_help=False)
+    selection.add_argument('--title', help='job title, shell wildcards allowed (e.g. "billing*")')
+    selection.add_argument('--directory', help='$BIN directory of the script, wildcards allowed')
+    selection.add_argument('--script', help='script path, or just its file name, wildcards allowed')
+    selection.add_argument('--schedule', help='current schedule, e.g. "0 5 * * *"')
+
+    subparsers.add_parser('query', parents=[selection], help='list the jobs matching a title, directory, script or schedule')
+
+    edit = subparsers.add_parser('edit', parents=[selection], help='retime, disable or enable every matching job in one write')
+    change = edit.add_mutually_exclusive_group(required=True)
+    change.add_argument('--set-schedule', metavar='SCHEDULE', help='new schedule for the matching jobs')
+    change.add_argument('--disable', action='store_true', help='comment the matching jobs out')
+    change.add_argument('--enable', action='store_true', help='uncomment the matching jobs')
+    edit.add_argument('--dry-run', action='store_true', help='show the changes without writing the crontab')
+    edit.add_argument('--yes', action='store_true', help="don't ask for confirmation")
+
+    remove = subparsers.add_parser('remove', parents=[selection], help='remove every matching job in one write')
+    remove.add_argument('--dry-run', action='store_true', help='show the changes without writing the crontab')
+    remove.add_argument('--yes', action='store_true', help="don't ask for confirmation")
+
+    dispatch = subparsers.add_parser('dispatch', help='run jobs that share a schedule through one entry, a few at a time')
+    dispatch.add_argument('--schedule', help='only this schedule (default: every schedule with --min-jobs jobs)')
+    dispatch.add_argument('--min-jobs', type=int, default=5, help='dispatch schedules with at least this many jobs')
+    dispatch.add_argument('--workers', type=int, default=cron_dispatch.DEFAULT_WORKERS, help='jobs the dispatcher runs at once')
+    dispatch.add_argument('--undo', action='store_true', help='give the dispatched jobs back to cron')
+    dispatch.add_argument('--dry-run', action='store_true', help='show the changes without writing the crontab')
+    dispatch.add_argument('--yes', action='store_true', help="don't ask for confirmation")
+
+    simulate = subparsers.add_parser('simulate', help='forecast how many jobs run at once over a day, week or month')
+    period = simulate.add_mutually_exclusive_group()
+    period.add_argument('--day', action='store_true', help='simulate a day instead of a week')
+    period.add_argument('--month', action='store_true', help='simulate a whole month instead of a week')
+    simulate.add_argument('--date', type=parse_date, help='simulate the day/week/month containing this date (YYYYMMDD)')
+    simulate.add_argument('--schedule', help='also run a new job on this schedule and show where it makes things worse')
+    simulate.add_argument('--runtime', type=int, default=1, help='minutes the --schedule job runs for')
+    simulate.add_argument('--default-runtime', type=int, default=1,
+                          help='minutes to assume for jobs with no recorded runs')
+    simulate.add_argument('--top', type=int, default=5, help='number of worse windows to report')
+
+    scripts = subparsers.add_parser('scripts', help='update the index of $BIN scripts and list jobs whose script is missing')
+    scripts.add_argument('--rebuild', action='store_true', help='list every $BIN directory again instead of only changed ones')
+
+    daemon = subparsers.add_parser('daemon', help='run a local daemon that serializes edits to the crontab')
+    daemon.add_argument('--socket', help='Unix socket to listen on (default: one per rbmuser under '
+                        + cron_daemon.SHARED_DIR + ')')
+
+    env = subparsers.add_parser('env', help='show the rbmuser and billopsuser for this host and their cache')
+    env.add_argument('--refresh', action='store_true', help='look the users up in billing again and update the cache')
+    env.add_argument('--clear', action='store_true', help='remove the cached users so the next run looks them up again')
+
+    return parser.parse_args(argv)
+
+
+def parse_date(text):
+    try:
+        return datetime.datetime.strptime(text, '%Y%m%d')
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected a date like 20240131, got "' + text + '"')
+
 
 def main():
-    # Determine environment and user.
-    hostname = socket.gethostname().split(".")[0]
-    host_char = hostname[-1:]
-
-    if host_char == "p":
-        env = "PROD"
-    elif host_char == "t":
-        env = "TEST"
-    elif host_char == "i":
-        env = "INT"
-    elif host_char == "d":
-        env = "DEV"
-    else:
-        # TEST is the default server
-        env = "TEST"
+    args = parse_args()
+    set_output(args.output)
 
-    env = Environment(env=env)
-    rbmuser = env.servers['rbmuser']
+    # The daemon runs for good, its phases would never be written.
+    if args.command == 'daemon':
+        run_command(args)
+        return
 
-    billopsuser = env.servers['billopsuser']
+    cron_timing.start()
+    status = 'error'
+    try:
+        run_command(args)
+        status = 'ok'
+    except SystemExit as e:
+        status = 'ok' if not e.code else 'exit ' + str(e.code)
+        raise
+    except KeyboardInterrupt:
+        status = 'interrupted'
+        raise
+    finally:
+        save_timings(args, status)
+
+
+def save_timings(args, status):
+    # Timings are only a diagnostic, failing to save them doesn't fail the run.
+    command = args.command or 'walk-through'
+    try:
+        cron_timing.record(command, status)
+        if args.metrics_textfile:
+            cron_timing.write_textfile(args.metrics_textfile, command, status)
+    except OSError as e:
+        sys.stderr.write('Could not save timings: ' + str(e) + '\n')
+    if args.timings:
+        sys.stderr.write('\n'.join(cron_timing.report()) + '\n')
+
+
+def run_command(args):
+    if args.command == 'preview':
+        run_preview(args)
+        return
+    if args.command == 'overlaps':
+        run_overlaps(args)
+        return
+    if args.command == 'env':
+        run_env(args)
+        return
+    if args.command == 'fleet':
+        run_fleet(args)
+        return
+
+    # Every command from here on works on rbmuser's crontab, whoever runs it.
+    with phase('env'):
+        rbmuser, billopsuser = get_users()
+
+    if args.command == 'daemon':
+        try:
+            cron_daemon.serve(args.socket, rbmuser)
+        except cron_daemon.DaemonError as e:
+            print(str(e))
+            sys.exit(1)
+        except KeyboardInterrupt:
+            pass
+        return
+    if args.command == 'query':
+        run_query(args, rbmuser)
+        return
+    if args.command == 'simulate':
+        run_simulate(args, rbmuser)
+        return
+
+    if args.command == 'manifest':
+        run_manifest(args, rbmuser, billopsuser)
+        return
+    if args.command == 'analyze':
+        run_analyze(args, rbmuser)
+        return
+    if args.command == 'logs':
+        run_logs(args, billopsuser)
+        return
+    if args.command in ('edit', 'remove'):
+        run_edit(args, rbmuser, billopsuser)
+        return
+    if args.command == 'dispatch':
+        run_dispatch(args, rbmuser, billopsuser)
+        return
+    if args.command == 'missed':
+        run_missed(args, rbmuser, billopsuser)
+        return
+    if args.command == 'scripts':
+        run_scripts(args, rbmuser, billopsuser)
+        return
+    if args.command in ('history', 'diff', 'restore'):
+        store = cron_backup.BackupStore(backup_dir(billopsuser))
+        try:
+            if args.command == 'history':
+                run_history(args, store)
+            elif args.command == 'diff':
+                run_diff(args, store, rbmuser)
+            else:
+                run_restore(args, store, rbmuser, billopsuser)
+        except LookupError as e:
+            print(str(e))
+            sys.exit(1)
+        return
 
-    print()
+    print_text('')
     print_text('Billopsuser is: ' + billopsuser)
     print_text('Hit ctrl-c at any point to kill the script and then re-run to start over.')
-    print()
+    print_text('')
 
-    copy_crontab(billopsuser)
-    print()
+    copy_crontab(rbmuser, billopsuser)
+    print_text('')
 
+    scripts = load_scripts(billopsuser)
+    warn_broken_jobs(scripts, rbmuser)
+
+    replay = None
+    record = None
+    try:
+        if args.replay:
+            replay = sys.stdin if args.replay == '-' else open(args.replay)
+        if args.record:
+            record = open(args.record, 'a')
+    except OSError as e:
+        print_text(str(e), always=True)
+        sys.exit(1)
     try:
-        setup_job(rbmuser, billopsuser)
+        setup_jobs(rbmuser, billopsuser, args.record_runs, scripts, cron_walkthrough.AnswerSource(replay), record)
+    finally:
+        for f in (replay, record):
+            if f is not None and f is not sys.stdin:
+                f.close()
 
-    except Exception as e:
-        print_text('An error was encountered while trying to configure your job ')
-        print_text('(you probably fat-fingered an input).')
-        print_text('Reseting and starting over.')
-        print()
-        setup_job(rbmuser, billopsuser)
 
+def get_users(refresh=False):
+    # Determine environment and user, from the local cache when it is fresh.
+    return cron_env.resolve_users(refresh=refresh)
 
-def setup_job(rbmuser, billopsuser):
-    title_name = get_title_name()
-    title = '====== ' + title_name
-    print_text('#' + title)
-    print()
 
-    directory_name = get_directory_name()
-    print_text('Directory is $BIN/' + directory_name)
-    print()
+def run_env(args):
+    hostname = cron_env.short_hostname()
+    if args.clear:
+        if cron_env.clear_users(hostname):
+            print('Removed cached users for ' + hostname + '.')
+        else:
+            print('There are no cached users for ' + hostname + '.')
+        return
 
-    ksh_name = get_ksh_name()
-    print_text('ksh script is: ' + ksh_name)
-    print()
+    rbmuser, billopsuser = get_users(refresh=args.refresh)
+    cached = cron_env.load_users(hostname)
+    print('Host:        ' + hostname + ' (' + cron_env.environment_name(hostname) + ')')
+    print('rbmuser:     ' + rbmuser)
+    print('billopsuser: ' + billopsuser)
+    if cached:
+        age = int(time.time() - cached[2])
+        print('Cached ' + str(age // 60) + ' minutes ago in ' + cron_env.cache_path(hostname)
+              + ', refreshed after ' + str(cron_env.CACHE_TTL // 60) + ' minutes.')
 
-    cron = CronTab(user=str(rbmuser))
-    # cron = CronTab(user='jcroskrey')
 
-    script_to_run = ' /usr/local/rbm/home_dirs/' + billopsuser + '/bin/' + directory_name + '/' + ksh_name
-    log_file = ' >> /usr/local/rbm/home_dirs/' + billopsuser + '/log/' + ksh_name[:-4] + '_`hostname`_`date +%Y%m%d`.log 2>&1'
+def run_manifest(args, rbmuser, billopsuser):
+    from crontab import CronTab
+    import cron_manifest
 
-    job = cron.new(
-        command=script_to_run + log_file,
-        user=str(rbmuser),
-        comment=title,
-        pre_comment=True,
-    )
+    try:
+        rows = cron_manifest.load_manifest(args.path)
+    except (OSError, ValueError, cron_manifest.ManifestError) as e:
+        print('Could not read manifest: ' + str(e))
+        sys.exit(1)
+
+    with phase('load'):
+        transaction = cron_apply.Transaction(user=rbmuser)
+    with phase('parse'):
+        cron = CronTab(tab=transaction.base)
+    valid, errors = cron_manifest.validate_rows(rows, transaction.titles())
+
+    if args.dry_run:
+        for number, message in errors:
+            print('Row ' + str(number) + ': ' + message)
+        print(str(len(valid)) + ' of ' + str(len(rows)) + ' rows are valid (dry run, crontab not written).')
+        sys.exit(1 if errors else 0)
+
+    apply_errors = []
+    if valid:
+        copy_crontab(rbmuser, billopsuser)
+        known = set(id(job) for job in cron)
+        apply_errors = cron_manifest.apply_rows(cron, valid, rbmuser, billopsuser, args.record_runs)
+        try:
+            write_jobs(transaction, [job for job in cron if id(job) not in known])
+        except cron_apply.ConflictError as e:
+            print(e.report())
+            sys.exit(1)
+        except (cron_daemon.DaemonError, OSError, ValueError) as e:
+            print('The jobs were not added: ' + str(e))
+            sys.exit(1)
+        copy_crontab(rbmuser, billopsuser)
+
+    errors = sorted(errors + apply_errors)
+    for number, message in errors:
+        print('Row ' + str(number) + ': ' + message)
+    print('Added ' + str(len(valid) - len(apply_errors)) + ' of ' + str(len(rows)) + ' jobs.')
+
+    if errors:
+        sys.exit(1)
+
+
+def run_fleet(args):
+    import cron_manifest
 
-    entered_time = enter_run_time(job)
+    try:
+        rows = cron_manifest.load_manifest(args.path)
+        if args.hosts:
+            hosts = [host.strip() for host in args.hosts.split(',') if host.strip()]
+        else:
+            hosts = cron_fleet.select_hosts(cron_fleet.load_hosts(args.hosts_file), args.env)
+    except (OSError, ValueError, cron_manifest.ManifestError) as e:
+        print('Could not read manifest or hosts: ' + str(e))
+        sys.exit(1)
+    if not hosts:
+        print('No hosts to update.')
+        sys.exit(1)
+
+    # Rows are checked once here, each host only checks for titles it
+    # already has.
+    valid, errors = cron_manifest.validate_rows(rows)
+    for number, message in errors:
+        print('Row ' + str(number) + ': ' + message)
+    if not valid:
+        print('No valid rows in ' + args.path + '.')
+        sys.exit(1)
+    if args.local:
+        transport = cron_fleet.LocalTransport(args.local)
+    else:
+        transport = cron_fleet.SSHTransport()
+    try:
+        results = cron_fleet.apply_fleet(transport, hosts, valid, args.record_runs, args.dry_run, args.workers,
+                                         args.runner)
+    except ValueError as e:
+        print(str(e))
+        sys.exit(1)
+
+    width = max(len(result.host) for result in results)
+    print('%-*s  %-4s  %5s  %8s  %s' % (width, 'HOST', 'ENV', 'ADDED', 'EXISTING', 'RESULT'))
+    for result in results:
+        if result.error:
+            outcome = 'FAILED: ' + result.error
+        elif args.dry_run:
+            outcome = 'dry run, not written'
+        else:
+            outcome = 'ok'
+        print('%-*s  %-4s  %5d  %8d  %s' % (width, result.host, result.env, len(result.added),
+                                            len(result.existing), outcome))
 
-    if not entered_time:
-        get_run_time(job)
+    failed = sum(1 for result in results if result.error)
+    print(str(len(results) - failed) + ' of ' + str(len(results)) + ' hosts updated'
+          + (' (dry run).' if args.dry_run else '.'))
+    if failed or errors:
+        sys.exit(1)
 
-    print()
-    print_text('Your cron job is:')
-    print_text(job)
 
-    cron.write()
-    print()
-    print_text('Done! Please double check your job for any typos using "crontab -l".')
+def run_preview(args):
+    try:
+        schedule = compile_schedule(' '.join(args.schedule.split()))
+    except ValueError as e:
+        print('Invalid schedule: ' + str(e))
+        sys.exit(1)
+
+    if args.start or args.end:
+        start = args.start or datetime.datetime.now()
+        end = args.end or start + datetime.timedelta(days=365)
+        runs = schedule.runs_between(start, end)
+    else:
+        runs = schedule.next_runs(args.count)
 
+    for run in runs:
+        print(run.strftime('%a %Y-%m-%d %H:%M'))
+    if not runs:
+        print('This schedule never fires.')
 
-def copy_crontab(billopsuser):
-    exists = os.path.exists('/usr/local/rbm/home_dirs/' + billopsuser + '/bin/cron_backups')
-    if not exists:
-        os.mkdir('/usr/local/rbm/home_dirs/' + billopsuser + '/bin/cron_backups')
 
-    todays_date = datetime.date.today().strftime("%Y%m%d")
+def run_analyze(args, rbmuser):
+    import cron_load
 
-    copy_exists = os.path.exists('/usr/local/rbm/home_dirs/' + billopsuser + '/bin/cron_backups/crontab.' + todays_date)
-    if copy_exists:
-        print_text('A copy of crontab from today already exists at:')
-        print_text('/usr/local/rbm/home_dirs/' + billopsuser + '/bin/cron_backups/crontab.' + todays_date)
+    schedules = cron_load.crontab_schedules(parse_crontab(cron_backup.current_crontab(rbmuser)))
+
+    day = (args.date or datetime.datetime.now()).date()
+    if args.month:
+        start, days = cron_load.month_period(day)
     else:
-        os.system('crontab -l > /usr/local/rbm/home_dirs/' + billopsuser + '/bin/cron_backups/crontab.' + todays_date)
-        print_text('Copied crontab to /usr/local/rbm/home_dirs/' + billopsuser + '/bin/cron_backups/crontab.' + todays_date)
-
-
-def get_directory_name():
-    print_text('Please enter the $BIN directory that your script exists in (no slashes or path, just the name):')
-    directory_name = input()
-    check_for_spaces = directory_name.split(' ')
-    if len(check_for_spaces) > 1:
-        print_text("Please don't include any spaces in the directory name.")
-        directory_name = get_directory_name()
-    elif len(directory_name) == 0:
-        print_text('Directory name cannot be empty.')
-        directory_name = get_directory_name()
-    elif directory_name[0] == '/':
-        directory_name = directory_name[1:]
-
-    return directory_name
-
-
-def get_title_name():
-    print_text("""Enter the title you would like to be at the top of your cron job i.e. #===== <title>:""")
-    title_name = input()
-    if len(title_name) == 0:
-        print_text('Title cannot be empty.')
-        title_name = get_title_name()
-    return title_name
-
-
-def get_ksh_name():
-    print_text('Enter name of your .ksh file:')
-    ksh_name = input().split('.')
-    if len(ksh_name) == 0:
-        print_text('Name cannot be empty.')
-        ksh_name = get_ksh_name()
-    elif len(ksh_name) > 2:
-        print_text('Name cannot have more than 1 dot in name.')
-        ksh_name = get_ksh_name()
-
-    final_name = ksh_name[0] + '.ksh'
-
-    return final_name
-
-
-def enter_run_time(job):
-    print_text("Do you want to enter the cron schedule using cron's syntax?")
-    print_text('Or do you want to be walked through it? (cron or walk-through) c|w')
-    choice = input().lower()
-    if choice == 'c':
-        print_text('Enter the schedule in the form (without brackets) <* * * * *>')
-        schedule = input().rstrip()
-        job.setall(schedule)
-        return True
-
-    elif choice == 'w':
-        return False
-
-
-def get_run_time(job):
-    print_text("Enter 'restart' at any point to restart the walk-through.")
-    while True:
-        day_of_week = False
-        week_interval = False
-        job.every().minute()                                 # If restarted, this line will reset time to * * * * *
-        print_text('Will this job run every minute? y|n')
-        c = input().lower()
-        if c == 'y':
-            pass
+        start, days = cron_load.week_period(day)
 
-        elif c == 'n':
-
-            print_text('When called, will this job run at only one minute of the hour? y|n')
-            choice = input().lower()
-
-            if choice == 'y':
-                print_text('What minute of the hour will it run? 0-59')
-                minute_ = input()
-                if minute_ == 'restart':
-                    print_text('Starting over.')
-                    get_run_time(job)
-                    break
-                minute = int(minute_)
-                job.minute.on(minute)
-
-            elif choice == 'n':
-                print_text('Will it run on an [i]nterval (every __ days)? Or at [s]pecific minutes? i|s')
-                setting = input().lower()
-
-                if setting == 'i':
-                    print_text('Every how many minutes do you want this to run? 0-59')
-                    num = input()
-                    if num == 'restart':
-                        print_text('Starting over.')
-                        get_run_time(job)
-                        break
-
-                    job.minute.every(int(num))
-
-                elif setting == 's':
-                    print_text('What minutes do you want it to run at? (comma delimited, no spaces) 1-60')
-                    minutes = input().split(',')
-                    if minutes == ['restart']:
-                        print_text('Starting over.')
-                        get_run_time(job)
-                        break
-                    job.minute.on(int(minutes[0]))
-                    for minute in minutes[1:]:
-                        job.minute.also.on(int(minute))
-
-                elif setting == 'restart':
-                    print_text('Starting over.')
-                    get_run_time(job)
-                    break
-
-                else:
-                    print_text('Your options are [i], [s], or [restart]. Restarting due to bad input.')
-                    get_run_time(job)
-                    break
-
-            elif choice == 'restart':
-                print_text('Starting over.')
-                get_run_time(job)
-                break
+    matrix = cron_load.occupancy([s for job, s in schedules], start, days)
+    load = cron_load.concurrency(matrix)
+    print('Analyzed ' + str(len(schedules)) + ' jobs over ' + str(days) + ' days from ' + start.strftime('%Y-%m-%d') + '.')
+    print('Busiest minute starts ' + str(int(load.max()) if len(load) else 0) + ' jobs; '
+          + str(int((load > 1).sum())) + ' minutes start more than one job.')
+    print()
 
-            else:
-                print_text('Your options are [y], [n], or [restart]. Restarting due to bad input.')
-                get_run_time(job)
-                break
+    for minute, count, rows in cron_load.peak_minutes(matrix, args.top):
+        when = cron_load.minute_to_datetime(start, minute)
+        print(when.strftime('%a %Y-%m-%d %H:%M') + '  ' + str(count) + ' jobs')
+        for row in rows[:ANALYZE_LABELS]:
+            print('    ' + cron_load.job_label(schedules[row][0]))
+        if len(rows) > ANALYZE_LABELS:
+            print('    ... and ' + str(len(rows) - ANALYZE_LABELS) + ' more')
+
+
+def run_history(args, store):
+    snapshots = store.snapshots()
+    rows = []
+    previous = {}
+    for number, snapshot in enumerate(snapshots):
+        jobs = store.jobs(snapshot.digest)
+        added, removed, changed = cron_backup.diff_jobs(previous, jobs)
+        previous = jobs
+        if args.job and not any(key == args.job for key in
+                                [a[0] for a in added] + [r[0] for r in removed] + [c[0] for c in changed]):
+            continue
+        rows.append((number, snapshot, len(jobs), added, removed, changed))
+
+    for number, snapshot, count, added, removed, changed in rows[-args.limit:]:
+        taken = datetime.datetime.fromtimestamp(snapshot.time).strftime('%Y-%m-%d %H:%M:%S')
+        print(str(number).rjust(5) + '  ' + taken + '  ' + snapshot.digest[:10] + '  ' + str(count).rjust(4) + ' jobs  '
+              + '+' + str(len(added)) + ' -' + str(len(removed)) + ' ~' + str(len(changed)))
+        if args.job:
+            print_job_diff(added, removed, changed, indent='        ')
+    if not rows:
+        print('No backups found.')
+
+
+def snapshot_jobs(store, ref, rbmuser):
+    if ref == 'current':
+        return 'current crontab', cron_backup.job_lines(cron_backup.current_crontab(rbmuser))
+    snapshot = store.resolve(ref)
+    taken = datetime.datetime.fromtimestamp(snapshot.time).strftime('%Y-%m-%d %H:%M:%S')
+    return 'backup ' + taken + ' ' + snapshot.digest[:10], store.jobs(snapshot.digest)
+
+
+def run_diff(args, store, rbmuser):
+    old_name, old = snapshot_jobs(store, args.old, rbmuser)
+    new_name, new = snapshot_jobs(store, args.new, rbmuser)
+    print('--- ' + old_name)
+    print('+++ ' + new_name)
+    if not print_job_diff(*cron_backup.diff_jobs(old, new)):
+        print('No job differences.')
+
+
+def print_job_diff(added, removed, changed, indent=''):
+    for key, line in added:
+        print(indent + '+ #' + key)
+        print(indent + '+     ' + line)
+    for key, line in removed:
+        print(indent + '- #' + key)
+        print(indent + '-     ' + line)
+    for key, old_line, new_line in changed:
+        print(indent + '~ #' + key)
+        print(indent + '-     ' + old_line)
+        print(indent + '+     ' + new_line)
+    return bool(added or removed or changed)
+
+
+def run_restore(args, store, rbmuser, billopsuser):
+    snapshot = store.resolve(args.backup)
+    text = store.read(snapshot.digest)
+    current = cron_backup.job_lines(cron_backup.current_crontab(rbmuser))
+    taken = datetime.datetime.fromtimestamp(snapshot.time).strftime('%Y-%m-%d %H:%M:%S')
+
+    print('Restoring the crontab backed up at ' + taken + ' will change:')
+    if not print_job_diff(*cron_backup.diff_jobs(current, store.jobs(snapshot.digest))):
+        print('No job differences.')
+    if not args.yes:
+        print('Restore it? y|n')
+        if input().lower() != 'y':
+            print('Nothing changed.')
+            return
+
+    # Under the same lock as Transaction.commit(), so a write another run
+    # has already checked doesn't land on top of the restore.
+    with cron_apply.locked(rbmuser):
+        copy_crontab(rbmuser, billopsuser)
+        cron_backup.install_crontab(text, rbmuser)
+    copy_crontab(rbmuser, billopsuser)
+    print('Restored the crontab from ' + taken + '.')
+
+
+def select_jobs(args, entries):
+    import cron_query
+
+    index = cron_query.JobIndex(entries)
+    return index.select(args.title, args.directory, args.script, args.schedule)
+
+
+def print_entries(entries):
+    for entry in entries:
+        state = ''
+        if is_dispatched(entry):
+            state = '  (dispatched)'
+        elif not entry.enabled:
+            state = '  (disabled)'
+        print((entry.title or '(no title)') + state)
+        print('    ' + entry.schedule + '  ' + script_from_command(entry.command))
+
+
+def run_query(args, rbmuser):
+    entries = select_jobs(args, parse_crontab(cron_backup.current_crontab(rbmuser)))
+    print_entries(entries)
+    print(str(len(entries)) + ' matching jobs.')
+
+
+def run_edit(args, rbmuser, billopsuser):
+    # edit and remove: one change to every matching job, in one write.
+    if not (args.title or args.directory or args.script or args.schedule):
+        print('Give at least one of --title, --directory, --script or --schedule to pick the jobs.')
+        sys.exit(1)
+
+    transaction = cron_apply.Transaction(user=rbmuser)
+    entries = select_jobs(args, transaction.entries())
+    if not entries:
+        print('No jobs match.')
+        return
+
+    if args.command == 'remove':
+        op = 'remove'
+    elif args.set_schedule:
+        op = 'retime'
+    else:
+        op = 'disable' if args.disable else 'enable'
+    before = transaction.lines
+    try:
+        transaction.edit_entries(entries, op, getattr(args, 'set_schedule', None))
+    except ValueError as e:
+        print('Invalid schedule: ' + str(e))
+        sys.exit(1)
+
+    commit_changes(args, transaction, before, 'This will ' + op + ' ' + str(len(entries)) + ' matching jobs.',
+                   billopsuser)
+
+
+def commit_changes(args, transaction, before, summary, billopsuser):
+    # Shows how transaction changes the lines it started from (before), then
+    # writes it unless this is a dry run or the user says no.
+    for first, end, lines in cron_apply.hunks(before, transaction.lines):
+        for line in before[first:end]:
+            print('- ' + line)
+        for line in lines:
+            print('+ ' + line)
+    print(summary)
+    if args.dry_run:
+        print('Dry run, crontab not written.')
+        return
+    if not args.yes:
+        print('Go ahead? y|n')
+        if input().lower() != 'y':
+            print('Nothing changed.')
+            return
+
+    copy_crontab(transaction.user, billopsuser)
+    try:
+        with phase('write'):
+            transaction.commit()
+    except cron_apply.ConflictError as e:
+        print(e.report())
+        sys.exit(1)
+    copy_crontab(transaction.user, billopsuser)
+    print('Done.')
+
+
+def run_dispatch(args, rbmuser, billopsuser):
+    # Moves the jobs of each busy schedule behind one cron_dispatch.py entry,
+    # or with --undo hands them back to cron.
+    schedule = ' '.join(args.schedule.split()) if args.schedule else None
+    transaction = cron_apply.Transaction(user=rbmuser)
+    before = transaction.lines
+    entries = transaction.entries()
+
+    if args.undo:
+        jobs = [e for e in entries if is_dispatched(e) and schedule in (None, e.schedule)]
+        transaction.edit_entries(jobs, 'enable')
+        dispatchers = set(dispatch_title(e.schedule) for e in jobs)
+        if schedule:
+            dispatchers.add(dispatch_title(schedule))
+        transaction.edit_entries([e for e in transaction.entries() if e.title in dispatchers], 'remove')
+        summary = 'This will give ' + str(len(jobs)) + ' dispatched jobs back to cron.'
+    else:
+        titles = set(e.title for e in entries)
+        groups = {}
+        for entry in entries:
+            if entry.enabled and entry.schedule != '@reboot' and not entry.title.startswith(dispatch_title('')):
+                groups.setdefault(entry.schedule, []).append(entry)
+        chosen = sorted(s for s, jobs in groups.items()
+                        if schedule in (None, s) and len(jobs) >= args.min_jobs)
+        if not chosen:
+            print('No schedule has ' + str(args.min_jobs) + ' or more jobs to dispatch.')
+            return
+        transaction.edit_entries([e for s in chosen for e in groups[s]], 'dispatch')
+        for s in chosen:
+            if dispatch_title(s) not in titles:
+                transaction.add(dispatch_title(s), s, dispatch_command(billopsuser, s, args.workers))
+        summary = ('This will run ' + str(sum(len(groups[s]) for s in chosen)) + ' jobs through '
+                   + str(len(chosen)) + ' dispatcher entries, ' + str(args.workers) + ' at a time.')
+
+    commit_changes(args, transaction, before, summary, billopsuser)
+
+
+def run_simulate(args, rbmuser):
+    import cron_load
+    import cron_simulate
+
+    day = (args.date or datetime.datetime.now()).date()
+    if args.day:
+        start, days, bucket = day, 1, 60
+    elif args.month:
+        (start, days), bucket = cron_load.month_period(day), cron_load.MINUTES_PER_DAY
+    else:
+        (start, days), bucket = cron_load.week_period(day), 6 * 60
+
+    added = []
+    if args.schedule:
+        schedule = ' '.join(args.schedule.split())
+        try:
+            compile_schedule(schedule)
+        except ValueError as e:
+            print('Invalid schedule: ' + str(e))
+            sys.exit(1)
+        added.append(cron_simulate.SimJob('new job', schedule, max(1, args.runtime), None, None))
+
+    entries = parse_crontab(cron_backup.current_crontab(rbmuser))
+    started = time.time()
+    before, after = cron_simulate.compare(entries, added, cron_runs.runtimes(), start, days, max(1, args.default_runtime))
+    print('Simulated ' + str(before.runs) + ' runs of ' + str(len(entries)) + ' crontab entries over ' + str(days)
+          + ' days from ' + start.strftime('%Y-%m-%d') + ' in ' + '%.2f' % (time.time() - started) + 's.')
+    print_simulation(before, start)
+
+    if added:
+        print()
+        print('With the new job:')
+        print_simulation(after, start)
+        print()
+        print_worse_windows(before, after, start, args.top, print)
+        return
 
-        elif c == 'restart':
-            print_text('Starting over.')
-            get_run_time(job)
-            break
+    print()
+    print('Jobs running at once:')
+    for minute, peak in cron_simulate.timeline(before.levels, bucket):
+        when = cron_load.minute_to_datetime(start, minute)
+        print('    ' + when.strftime('%a %Y-%m-%d %H:%M') + '  ' + str(peak).rjust(4) + '  ' + '#' * min(peak, 60))
+
+
+def print_simulation(result, start):
+    import cron_load
+    peak = int(result.levels.max()) if len(result.levels) else 0
+    when = cron_load.minute_to_datetime(start, result.levels.argmax()) if peak else None
+    print('Peak of ' + str(peak) + ' jobs at once' + (', first at ' + when.strftime('%a %Y-%m-%d %H:%M') if when else '') + '.')
+    if result.skipped or result.queued or result.waited:
+        print(str(result.skipped) + ' runs skipped and ' + str(result.queued) + ' queued by --single-instance, '
+              + str(result.waited) + ' waited for a dispatcher worker.')
+
+
+def print_worse_windows(before, after, start, top, output, several=False):
+    import cron_load
+    import cron_simulate
+    windows = cron_simulate.worse_windows(before.levels, after.levels, top)
+    if not windows:
+        output(('The new jobs never run' if several else 'The new job never runs')
+               + ' alongside more jobs than are already running.')
+        return
+    output('Where the new ' + ('jobs make' if several else 'job makes') + ' things worse:')
+    for first, end, was, now in windows:
+        output('    ' + cron_load.minute_to_datetime(start, first).strftime('%a %Y-%m-%d %H:%M')
+               + ' - ' + cron_load.minute_to_datetime(start, end).strftime('%H:%M')
+               + '  ' + str(was) + ' -> ' + str(now) + ' jobs at once')
+
+
+def run_scripts(args, rbmuser, billopsuser):
+    started = time.time()
+    scripts = load_scripts(billopsuser, args.rebuild)
+    if scripts is None:
+        print('Could not read ' + bin_dir(billopsuser) + '.')
+        sys.exit(1)
+    count = sum(len(scripts.scripts(name)) for name in scripts.directories())
+    print('Indexed ' + str(len(scripts.directories())) + ' directories and ' + str(count) + ' scripts under '
+          + scripts.root + ' in ' + '%.2f' % (time.time() - started) + 's.')
+
+    import cron_scripts
+    broken = cron_scripts.broken_jobs(scripts, parse_crontab(cron_backup.current_crontab(rbmuser)))
+    if not broken:
+        print('Every job in the crontab runs a script that exists and is executable.')
+        return
+    print()
+    print(str(len(broken)) + ' jobs run a missing or non-executable script:')
+    for entry, problem in broken:
+        print('    ' + (entry.title or entry.schedule).ljust(40) + '  ' + problem)
+
+
+def run_overlaps(args):
+    counts = cron_runs.overlap_counts(days=args.days)
+    if not counts:
+        print('No overlapping runs in the last ' + str(args.days) + ' days.')
+        return
+    print('Overlapping runs in the last ' + str(args.days) + ' days (consider a longer interval for these):')
+    for ksh, action, count in counts:
+        print(str(count).rjust(6) + '  ' + action.ljust(8) + '  ' + ksh)
+
+
+def run_logs(args, billopsuser):
+    db = cron_logindex.connect(args.index)
+    started = time.time()
+    new, refreshed, total = cron_logindex.update(db, log_dir(billopsuser))
+    print('Indexed ' + str(new) + ' new and ' + str(refreshed) + ' recent log files in '
+          + '%.1f' % (time.time() - started) + 's, ' + str(total) + ' in the index.')
+    print()
 
+    if not args.ksh:
+        for ksh, days, first, last, size in cron_logindex.summary(db):
+            print(ksh.ljust(40) + ' ' + str(days).rjust(6) + ' days  ' + first + ' - ' + last + '  ' + str(size) + ' bytes')
+        return
+
+    for day, host, size, start, end in cron_logindex.history(db, args.ksh.replace('.ksh', ''), args.host):
+        line = day + '  ' + host.ljust(12) + ' ' + str(size).rjust(10) + ' bytes'
+        if start:
+            line += '  ' + time.strftime('%H:%M:%S', time.localtime(start))
+            line += ' - ' + time.strftime('%H:%M:%S', time.localtime(end))
+            line += '  (' + str(int(end - start)) + 's)'
         else:
-            print_text('Your options are [y], [n], or [restart]. Restarting due to bad input.')
-            get_run_time(job)
-            break
+            line += '  last written ' + time.strftime('%H:%M:%S', time.localtime(end))
+        print(line)
 
-        print_text('Will this job run every hour of the day? y|n')
-        c = input().lower()
-        if c == 'y':
-            pass
 
-        elif c == 'n':
-            print_text('Will this job run at only one hour of the day? y|n')
-            choice = input().lower()
-            if choice == 'y':
-                print_text('What hour of the day will this job run? 0-23')
-                hour = input()
-                if hour == 'restart':
-                    print_text('Starting over.')
-                    get_run_time(job)
-                    break
-                job.hour.on(int(hour))
-
-            elif choice == 'n':
-                print_text('Will this job run in an hourly [i]nterval (every __ hours) or at [s]pecified hours of the day? i|s')
-                period = input().lower()
-                if period == 'i':
-                    print_text('Every how many hours do you want this to run? 0-23')
-                    interval = input()
-                    if interval == 'restart':
-                        print_text('Starting over.')
-                        get_run_time(job)
-                        break
-                    job.hour.every(int(interval))
-
-                elif period == 's':
-                    print_text('What specific hours of the day do you want this to run? (comma delimited, no spaces) 0-23')
-                    hours = input().split(',')
-                    if hours == ['restart']:
-                        print_text('Starting over.')
-                        get_run_time(job)
-                        break
-                    job.hour.on(int(hours[0]))
-                    for hour in hours[1:]:
-                        job.hour.also.on(int(hour))
-
-                elif period == 'restart':
-                    print_text('Starting over.')
-                    get_run_time(job)
-                    break
-                else:
-                    print_text('Your options are [i], [s], or [restart]. Restarting due to bad input.')
-                    get_run_time(job)
-                    break
-
-            elif choice == 'restart':
-                print_text('Starting over.')
-                get_run_time(job)
-                break
+def run_missed(args, rbmuser, billopsuser):
+    import cron_missed
 
-            else:
-                print_text('Your options are [y], [n], or [restart]. Restarting due to bad input.')
-                get_run_time(job)
-                break
+    # Today is left out by default, its runs may still be to come.
+    end = (args.end or datetime.datetime.now() - datetime.timedelta(days=1)).date()
+    start = args.start.date() if args.start else end - datetime.timedelta(days=args.days - 1)
 
-        elif c == 'restart':
-            print_text('Starting over.')
-            get_run_time(job)
-            break
+    db = cron_logindex.connect(args.index)
+    cron_logindex.update(db, log_dir(billopsuser))
+    entries = parse_crontab(cron_backup.current_crontab(rbmuser))
+    reports = cron_missed.find_missed(entries, db, start, end, args.host)
 
-        else:
-            print_text('Your options are [y], [n], or [restart]. Restarting due to bad input.')
-            get_run_time(job)
-            break
-
-        print_text('Will this job run every day of the week? y|n')
-        c = input().lower()
-        if c == 'y':
-            pass
-        elif c == 'n':
-            day_of_week = True
-            print_text('Does this job run only one day of the week? y|n')
-            choice = input()
-            if choice == 'y':
-                print_text('What day of the week will it run? (0=Sun, 1=Mon, etc...) 0-6')
-                week_day = input()
-                if week_day == 'restart':
-                    print_text('Starting over.')
-                    get_run_time(job)
-                    break
-                job.dow.on(int(week_day))
-
-            elif choice == 'n':
-                print_text('Will this job run on an [i]nterval (every <n-th> day per week) or on [s]pecific days of the week? i|s')
-                period = input().lower()
-                if period == 'i':
-                    week_interval = True
-                    print_text('Every which day each week do you want this to run (every nth day)? 0-6')
-                    interval = input()
-                    if interval == 'restart':
-                        print_text('Starting over.')
-                        get_run_time(job)
-                        break
-                    job.dow.every(int(interval))
-
-                elif period == 's':
-                    print_text('What days of the week will it run? (comma delimited, no spaces) 0-6')
-                    week_days = input().split(',')
-                    if week_days == ['restart']:
-                        print_text('Starting over.')
-                        get_run_time(job)
-                        break
-                    job.dow.on(int(week_days[0]))
-                    for day in week_days[1:]:
-                        job.dow.also.on(int(day))
-
-                elif period == 'restart':
-                    print_text('Starting over.')
-                    get_run_time(job)
-                    break
-
-                else:
-                    print_text('Your options are [i], [s], or [restart]. Restarting due to bad input.')
-                    get_run_time(job)
-                    break
-
-            elif choice == 'restart':
-                print_text('Starting over.')
-                get_run_time(job)
-                break
-            else:
-                print_text('Your options are [y], [n], or [restart]. Restarting due to bad input.')
-                get_run_time(job)
-                break
-
-        elif c == 'restart':
-            print_text('Starting over.')
-            get_run_time(job)
+    print('Checked ' + start.strftime('%Y-%m-%d') + ' to ' + end.strftime('%Y-%m-%d') + ' on ' + args.host + '.')
+    if not reports:
+        print('Every job logged on exactly the days it was scheduled.')
+        return
+    for report in reports:
+        print()
+        print(report.ksh)
+        if report.missed:
+            print('    no log on:      ' + ' '.join(report.missed))
+        if report.unexpected:
+            print('    unexpected log: ' + ' '.join(report.unexpected))
+
+
+def print_preview(job):
+    schedule = compile_schedule(job_expression(job))
+    if schedule.never:
+        print_text('This job runs only when the host starts.')
+        return
+    runs = schedule.next_runs(PREVIEW_RUNS)
+    if not runs:
+        print_text('Warning: this schedule never fires.')
+        return
+
+    print_text('The next ' + str(len(runs)) + ' runs will be:')
+    for run in runs:
+        print_text('    ' + run.strftime('%a %Y-%m-%d %H:%M'))
+    if schedule.day_or:
+        print_text('Note: both day of month and day of week are set, so this runs on days matching EITHER one.')
+
+
+def print_forecast(transaction, jobs):
+    # A week of the crontab simulated with and without the new jobs, using
+    # the runtimes cron_runner.py has recorded.
+    import cron_simulate
+    durations = cron_runs.runtimes()
+    new = [cron_simulate.SimJob('new job', job_expression(job),
+                                durations.get(ksh_from_command(job.command), cron_simulate.DEFAULT_RUNTIME), None, None)
+           for job in jobs]
+    start = datetime.date.today()
+    before, after = cron_simulate.compare(transaction.entries(), new, durations, start, 7)
+    print_text('')
+    print_text('Over the next week at most ' + str(int(before.levels.max())) + ' jobs run at once now, '
+               + str(int(after.levels.max())) + ' with ' + ('this job.' if len(jobs) == 1 else 'these jobs.'))
+    print_worse_windows(before, after, start, FORECAST_WINDOWS, print_text, len(jobs) > 1)
+
+
+def setup_jobs(rbmuser, billopsuser, record_runs=False, scripts=None, source=None, record=None):
+    # Walks through one job, or every job in a replayed answer file. A
+    # replay's jobs are written together, with one backup before and after.
+    from crontab import CronTab
+
+    source = source or cron_walkthrough.AnswerSource()
+    # Edits go through a transaction, so changes others make during the
+    # walk-through are merged rather than overwritten.
+    with phase('load'):
+        transaction = cron_apply.Transaction(user=rbmuser)
+    with phase('parse'):
+        cron = CronTab(tab=transaction.base)
+    durations = cron_runs.runtimes()
+    # What each new job is staggered against, including the jobs added
+    # before it in a replay.
+    others = transaction.entries()
+    walkthrough = cron_walkthrough.Walkthrough(source, print_text, transaction.titles(), scripts, set_completion)
+
+    jobs = []
+    answer_lines = []
+    while True:
+        # Includes the time spent answering.
+        with phase('answers'):
+            try:
+                answers = walkthrough.run()
+            except cron_walkthrough.WalkthroughError as e:
+                print_text(str(e), always=True)
+                print_text('Nothing was written.', always=True)
+                sys.exit(1)
+        if answers is None:
             break
 
-        else:
-            print_text('Your options are [y], [n], or [restart]. Restarting due to bad input.')
-            get_run_time(job)
+        job = cron.new(
+            command=build_command(billopsuser, answers.directory, answers.ksh, record_runs, answers.overlap),
+            user=str(rbmuser),
+            comment=make_title(answers.title),
+            pre_comment=True,
+        )
+        job.setall(answers.schedule)
+        if answers.auto_minute:
+            with phase('stagger'):
+                stagger_job(job, answers.auto_hour, others, durations)
+        jobs.append(job)
+        others.extend(parse_crontab(str(job)))
+        answer_lines.extend(answers.answers)
+
+        if not source.replaying:
+            print_text('')
+            print_text('Your cron job is:', always=True)
+            print_text(job, always=True)
+            print_text('')
+            print_preview(job)
             break
+        print_text(job, always=True)
+        schedule = compile_schedule(job_expression(job))
+        if not schedule.never and not schedule.next_runs(1):
+            print_text('Warning: this schedule never fires.', always=True)
 
-        if day_of_week:
-            print_text('Since you have specified a per-week schedule, do you want this to ONLY run on a per-week schedule?')
-            print_text('(as opposed to a per-week AND per-month schedule) y|n')
-            if week_interval:
-                print_text('Keep in mind that since you have specified an interval of the week for the job to run,')
-                print_text('choosing a per-month period to run will make the job called only when the schedule')
-                print_text('matches BOTH your weekly interval AND your monthly scheduled time. For example: Running')
-                print_text('every Friday if it is ALSO every 5th day of the month.')
-
-        else:
-            print_text('Will this job run every day of the month? y|n')
+    if not jobs:
+        print_text('There were no jobs to add.', always=True)
+        return
 
-        c = input().lower()
-        if c == 'y':
-            pass
-        elif c == 'n':
-            print_text('Will this job run only once a month? y|n')
-            choice = input().lower()
-
-            if choice == 'y':
-                print_text('What day of the month will it run on? 1-31')
-                if day_of_week:
-                    if week_interval:
-                        print_text('Since you have specified a week-interval for this to run, this will run on both')
-                        print_text('the day/days of the week you chose IF it is AlSO the day of the month you choose now.')
-                    else:
-                        print_text('Since you have specified day/days of the week for this to run, this will run on both')
-                        print_text('the day/days of the week you chose AND the day of the month you choose now.')
-                day = input()
-                if day == 'restart':
-                    print_text('Starting over.')
-                    get_run_time(job)
-                    break
-                job.dom.on(int(day))
-
-            elif choice == 'n':
-                print_text('Will this job run on an [i]nterval (every __ days per month) or on [s]pecified days each month? i|s')
-                period = input().lower()
-                if period == 'i':
-                    print_text('Every how many days per month will this to run? 0-31')
-                    if day_of_week:
-                        print_text('Since you have specified day/days of the week for this to run, this will run on')
-                        print_text('the day/days of the week you chose IF it ALSO aligns with the interval that you')
-                        print_text('specify now.')
-                    interval = input()
-                    if interval == 'restart':
-                        print_text('Starting over.')
-                        get_run_time(job)
-                        break
-                    job.dom.every(int(interval))
-
-                elif period == 's':
-                    print_text('What specific days of the month will this job run? (comma delimited, no spaces) 0-31')
-                    if day_of_week:
-                        print_text('Since you have specified day/days of the week for this to run, this will run on')
-                        print_text('both the day/days of the week you chose AND the days of the month you choose now.')
-                    specific = input().split(',')
-                    if specific == ['restart']:
-                        print_text('Starting over.')
-                        get_run_time(job)
-                        break
-                    job.dom.on(int(specific[0]))
-                    for day in specific[1:]:
-                        job.dom.also.on(int(day))
-
-                elif period == 'restart':
-                    print_text('Starting over.')
-                    get_run_time(job)
-                    break
-
-                else:
-                    print_text('Your options are [i], [s], or [restart]. Restarting due to bad input.')
-                    get_run_time(job)
-                    break
-
-            elif choice == 'restart':
-                print_text('Starting over.')
-                get_run_time(job)
-                break
+    with phase('forecast'):
+        print_forecast(transaction, jobs)
 
-            else:
-                print_text('Your options are [y], [n], or [restart]. Restarting due to bad input.')
-                get_run_time(job)
-                break
+    try:
+        write_jobs(transaction, jobs)
+    except cron_apply.ConflictError as e:
+        print_text(e.report(), always=True)
+        sys.exit(1)
+    except (cron_daemon.DaemonError, OSError, ValueError) as e:
+        print_text('The jobs were not added: ' + str(e), always=True)
+        sys.exit(1)
+    if record:
+        # Appended, so sessions recorded one after another replay as one.
+        record.write(''.join(answer + '\n' for answer in answer_lines))
+        record.flush()
+    print_text('')
+    copy_crontab(rbmuser, billopsuser)
+    if source.replaying:
+        print_text('Added ' + str(len(jobs)) + ' jobs.', always=True)
+    else:
+        print_text('Done! Please double check your job for any typos using "crontab -l".', always=True)
+
+
+def write_jobs(transaction, jobs):
+    # Adds the new jobs through the daemon when one is running, so edits from
+    # several operators are applied one after another. Otherwise commits them
+    # in transaction. python-crontab's own write() would drop the title
+    # comments of every other job.
+    with phase('write'):
+        specs = []
+        for job in jobs:
+            match = TITLE_RE.match('# ' + (job.comment or ''))
+            specs.append({
+                'title': match.group(2) if match else job.comment,
+                'schedule': job_expression(job),
+                'command': job.command,
+            })
+        path = cron_daemon.socket_path(transaction.user)
+        if cron_daemon.running(path):
+            cron_daemon.call({'op': 'add', 'user': transaction.user, 'jobs': specs}, path)
+            print_text('Added through the daemon at ' + path + '.')
+            return
+        transaction.edit({'op': 'add', 'jobs': specs})
+        transaction.commit()
+        if transaction.merged:
+            print_text('The crontab changed while you were working, your job was merged in with those changes.')
+
+
+def copy_crontab(rbmuser, billopsuser):
+    # Snapshot rbmuser's crontab into the backup store. Unchanged crontabs
+    # are not stored twice, so this is cheap to call before and after every
+    # write.
+    with phase('backup'):
+        store = cron_backup.BackupStore(backup_dir(billopsuser))
+        text = cron_backup.current_crontab(rbmuser)
+        # $BIN/cron_backups is on NFS.
+        with phase('store'):
+            snapshot, created = store.snapshot(text)
+    taken = datetime.datetime.fromtimestamp(snapshot.time).strftime('%Y-%m-%d %H:%M:%S')
+    if created:
+        print_text('Backed up crontab to ' + store.object_path(snapshot.digest))
+    else:
+        print_text('Crontab is unchanged since the backup taken at ' + taken + ':')
+        print_text(store.object_path(snapshot.digest))
 
-        elif c == 'restart':
-            print_text('Starting over.')
-            get_run_time(job)
-            break
 
-        else:
-            print_text('Your options are [y], [n], or [restart]. Restarting due to bad input.')
+def backup_dir(billopsuser):
+    return '/usr/local/rbm/home_dirs/' + billopsuser + '/bin/cron_backups'
 
-        print_text('Will this job run every month of the year? y|n')
-        c = input().lower()
-        if c == 'y':
-            pass
 
-        elif c == 'n':
-            print_text('Will this job run only one month of the year? y|n')
-            choice = input().lower()
-            if choice == 'y':
-                print_text('What month will this run? 1-12')
-                month = input()
-                if month == 'restart':
-                    print_text('Starting over.')
-                    get_run_time(job)
-                    break
-                job.month.on(int(month))
-
-            elif choice == 'n':
-                print_text('Will this job run on an [i]nterval (every __ months per year) or on [s]pecific months? i|s')
-                period = input().lower()
-                if period == 'i':
-                    print_text('Every how many months will this run? 1-12')
-                    interval = input()
-                    if interval == 'restart':
-                        print_text('Starting over.')
-                        get_run_time(job)
-                        break
-                    job.month.every(int(interval))
-
-                elif period == 's':
-                    print_text('What specific months will this job run? (comma delimited, no spaces) 1-12')
-                    months = input().split(',')
-                    if months == ['restart']:
-                        print_text('Starting over.')
-                        get_run_time(job)
-                        break
-                    job.month.on(int(months[0]))
-                    for month in months[1:]:
-                        job.month.also.on(int(month))
-
-                elif period == 'restart':
-                    print_text('Starting over.')
-                    get_run_time(job)
-                    break
-
-                else:
-                    print_text('Your options are [i], [s], or [restart]. Restarting due to bad input.')
-                    get_run_time(job)
-                    break
-
-            elif choice == 'restart':
-                print_text('Starting over.')
-                get_run_time(job)
-                break
+def load_scripts(billopsuser, rebuild=False):
+    # The $BIN script index, brought up to date. None when $BIN can't be
+    # read, in which case nothing is checked.
+    import cron_scripts
 
-            else:
-                print_text('Your options are [y], [n], or [restart]. Restarting due to bad input.')
-                get_run_time(job)
-                break
+    index = cron_scripts.ScriptIndex(billopsuser)
+    if rebuild:
+        index.clear()
+    try:
+        with phase('scripts'):
+            index.refresh()
+    except OSError:
+        return None
+    try:
+        index.save()
+    except OSError:
+        pass
+    return index
 
-        elif c == 'restart':
-            print_text('Starting over.')
-            get_run_time(job)
-            break
 
-        else:
-            print_text('Your options are [y], [n], or [restart]. Restarting due to bad input.')
+def set_completion(words):
+    # Tab completes from words at the next input() where readline exists.
+    try:
+        import readline
+    except ImportError:
+        return
+    import cron_scripts
+    readline.set_completer_delims(' \t\n/')
+    readline.set_completer(cron_scripts.completer(words))
+    readline.parse_and_bind('tab: complete')
 
-        break
 
+def warn_broken_jobs(scripts, rbmuser):
+    import cron_scripts
 
-def print_text(text):
-    text = text
-    for i in str(text):
-        sys.stdout.write(i)
-        sys.stdout.flush()
-        time.sleep(0.01)
-    print()
+    if scripts is None:
+        return
+    try:
+        entries = parse_crontab(cron_backup.current_crontab(rbmuser))
+    except OSError:
+        return
+    broken = cron_scripts.broken_jobs(scripts, entries)
+    if broken:
+        print_text('Warning: ' + str(len(broken)) + ' jobs in the crontab run a missing or non-executable script, '
+                   + 'see "./automate_cron.py scripts".')
+        print_text('')
+
+
+def stagger_job(job, auto_hour, entries, durations=None):
+    # Moves job to the minute (and hour if auto_hour) where it adds the least
+    # to peak concurrency against the parse_crontab() entries of the rest of
+    # its crontab. durations gives each other job's runtime in minutes when
+    # it is known.
+    import cron_load
+
+    others = cron_load.crontab_schedules(entries)
+    schedule = compile_schedule(job_expression(job))
+    hours = None if auto_hour else schedule.hour_list
+    runtimes = None
+    if durations:
+        runtimes = [durations.get(ksh_from_command(other.command), 1) for other, s in others]
+
+    hour, minute = cron_load.best_slot(
+        [s for other, s in others],
+        schedule,
+        hours,
+        None,
+        durations=runtimes,
+        duration=(durations or {}).get(ksh_from_command(job.command), 1),
+    )
+    job.minute.on(minute)
+    if auto_hour:
+        job.hour.on(hour)
+        print_text('Picked ' + str(hour) + ':' + str(minute).zfill(2) + ' as the least busy time.')
+    else:
+        print_text('Picked minute ' + str(minute) + ' as the least busy minute.')
+
+
+def set_output(profile):
+    # instant: print_text writes straight away, and everything printed
+    # between two prompts leaves in one write when input() flushes stdout.
+    # typewriter: the old one-character-at-a-time effect, only on a TTY.
+    # quiet: only results and errors, for scripted runs.
+    global output_profile
+    if profile == 'typewriter' and not sys.stdout.isatty():
+        profile = 'instant'
+    output_profile = profile
+    if profile != 'typewriter' and hasattr(sys.stdout, 'reconfigure'):
+        sys.stdout.reconfigure(line_buffering=False)
+
+
+def print_text(text, always=False):
+    if output_profile == 'quiet' and not always:
+        return
+    if output_profile == 'typewriter':
+        for i in str(text):
+            sys.stdout.write(i)
+            sys.stdout.flush()
+            time.sleep(0.01)
+        sys.stdout.write('\n')
+        return
+    sys.stdout.write(str(text) + '\n')
 
 
 if __name__ == '__main__':
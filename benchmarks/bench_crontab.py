@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# Times the crontab paths that grow with the size of the crontab, on
+# synthetic crontabs of 10 to 50,000 jobs written the way setup_jobs() writes
+# them: a "#====== title" line, then the job with its log redirect.
+#
+#   python benchmarks/bench_crontab.py [--sizes 10,1000,50000] [-n RUNS]
+#   python benchmarks/bench_crontab.py --save-baseline
+#
+# Every run is compared with the saved baseline (if there is one), and
+# --check exits 1 when any case is more than --threshold slower.
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from crontab import CronTab  # noqa: E402
+
+import cron_apply  # noqa: E402
+import cron_backup  # noqa: E402
+from cron_jobs import build_command, make_title, parse_crontab, render_entry  # noqa: E402
+from cron_query import JobIndex  # noqa: E402
+from cron_schedule import compile_schedule  # noqa: E402
+
+DEFAULT_SIZES = (10, 100, 1000, 10000, 50000)
+DEFAULT_BASELINE = os.path.join(HERE, 'crontab_baseline.json')
+BILLOPSUSER = 'billops'
+DIRECTORIES = 20
+# Roughly the mix of a real crontab: mostly daily and weekday jobs, a few
+# hourly and interval ones.
+SCHEDULES = (
+    (70, '{m} {h} * * *'),
+    (15, '{m} {h} * * 1-5'),
+    (8, '{m} {h} * * {w}'),
+    (4, '{m} {h} {d} * *'),
+    (2, '{m} * * * *'),
+    (1, '*/15 * * * *'),
+)
+
+
+def synthetic_crontab(size, seed=0):
+    rng = random.Random(seed)
+    weights = [weight for weight, _ in SCHEDULES]
+    formats = [fmt for _, fmt in SCHEDULES]
+    parts = []
+    for n in range(size):
+        schedule = rng.choices(formats, weights)[0].format(
+            m=rng.randint(0, 59), h=rng.randint(0, 23), w=rng.randint(0, 6), d=rng.randint(1, 28))
+        command = build_command(BILLOPSUSER, 'dir%02d' % (n % DIRECTORIES), 'job%05d.ksh' % n)
+        parts.append(render_entry(make_title('job %d' % n), schedule, command))
+    return ''.join(parts)
+
+
+def time_case(run, runs, setup=None):
+    # Median seconds of run(state) over runs, where state comes from an
+    # untimed setup() before each run.
+    times = []
+    result = None
+    for _ in range(runs):
+        state = setup() if setup else None
+        started = time.perf_counter()
+        result = run(state)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), result
+
+
+def bench_size(size, runs, work):
+    # [(case, seconds, note)] for a crontab of size jobs.
+    text = synthetic_crontab(size)
+    path = os.path.join(work, 'crontab.' + str(size))
+    with open(path, 'w') as f:
+        f.write(text)
+    lines = text.splitlines()
+    entries = parse_crontab(text)
+    command = build_command(BILLOPSUSER, 'dir00', 'new.ksh')
+    results = []
+
+    seconds, cron = time_case(lambda _: CronTab(tabfile=path), runs)
+    results.append(('load CronTab(tabfile)', seconds, str(len(cron)) + ' jobs'))
+
+    seconds, parsed = time_case(lambda _: parse_crontab(text), runs)
+    results.append(('parse_crontab', seconds, str(len(parsed)) + ' entries'))
+
+    def add_python_crontab(cron):
+        job = cron.new(command=command, comment=make_title('new job'), pre_comment=True)
+        job.setall('30 4 * * *')
+    seconds, _ = time_case(add_python_crontab, runs, lambda: CronTab(tabfile=path))
+    results.append(('add (python-crontab)', seconds, ''))
+
+    def add_transaction(transaction):
+        transaction.add('new job', '30 4 * * *', command)
+    seconds, _ = time_case(add_transaction, runs, lambda: cron_apply.Transaction(text))
+    results.append(('add (transaction)', seconds, 'checks titles'))
+
+    def retime_directory(transaction):
+        matches = JobIndex(transaction.entries()).select(directory='dir03')
+        transaction.edit_entries(matches, 'retime', '15 2 * * *')
+        return matches
+    seconds, matches = time_case(retime_directory, runs, lambda: cron_apply.Transaction(text))
+    results.append(('bulk retime', seconds, str(len(matches)) + ' jobs'))
+
+    out = os.path.join(work, 'written')
+    seconds, _ = time_case(lambda cron: cron.write(out), runs, lambda: CronTab(tabfile=path))
+    results.append(('write (python-crontab)', seconds, 'drops titles'))
+
+    # What commit() does when someone else changed the crontab meanwhile:
+    # we retimed one directory and they removed every 50th job.
+    ours = cron_apply.bulk_edit(lines, [e for e in entries if '/dir03/' in e.command], 'retime', '15 2 * * *')
+    theirs = cron_apply.bulk_edit(lines, [e for e in entries[::50] if '/dir03/' not in e.command], 'remove')
+    seconds, merged = time_case(lambda _: cron_apply.merge(lines, ours, theirs), runs)
+    results.append(('write (three-way merge)', seconds, str(len(merged)) + ' lines'))
+
+    # A new crontab each time, so every run compresses and stores it.
+    store = cron_backup.BackupStore(os.path.join(work, 'backups.' + str(size)))
+    variants = iter(range(runs))
+    seconds, _ = time_case(lambda variant: store.snapshot(variant), runs,
+                           lambda: text + '# run ' + str(next(variants)) + '\n')
+    results.append(('backup snapshot', seconds, '%.0f KB' % (len(text) / 1024.0)))
+
+    year = datetime.datetime(datetime.date.today().year, 1, 1)
+    next_year = year.replace(year=year.year + 1)
+
+    def expand(_):
+        return sum(len(compile_schedule(e.schedule).minutes_between(year, next_year)) for e in entries)
+    # Tens of seconds at 50,000 jobs, so large sizes only expand once.
+    seconds, fires = time_case(expand, runs if size < 10000 else 1)
+    results.append(('expand a year of fires', seconds, str(fires) + ' fires'))
+    return results
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time crontab load, edit, write, backup and expansion at scale.')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='comma separated numbers of jobs')
+    parser.add_argument('-n', '--runs', type=int, default=5, help='runs per case (the median is kept)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline results file')
+    parser.add_argument('--save-baseline', action='store_true', help='save these results as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='fraction slower than the baseline that counts as a regression')
+    parser.add_argument('--check', action='store_true', help='exit 1 when any case regressed')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    baseline = load_baseline(args.baseline)
+    if baseline and baseline.get('host') != platform.node():
+        print('Baseline was taken on ' + str(baseline.get('host')) + ', comparisons are rough.')
+    old = (baseline or {}).get('results', {})
+
+    results = {}
+    regressions = []
+    work = tempfile.mkdtemp(prefix='bench_crontab.')
+    try:
+        for size in sizes:
+            print('%d jobs' % size)
+            for case, seconds, note in bench_size(size, args.runs, work):
+                key = case + ' @' + str(size)
+                results[key] = seconds
+                line = '    %-26s %10.2f ms  %-16s' % (case, seconds * 1000, note)
+                if key in old and old[key] > 0:
+                    ratio = seconds / old[key]
+                    line += '  %5.2fx baseline' % ratio
+                    if ratio > 1 + args.threshold:
+                        line += '  SLOWER'
+                        regressions.append(key)
+                print(line.rstrip())
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    if args.save_baseline:
+        old.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump({'host': platform.node(), 'python': platform.python_version(),
+                       'saved': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': old}, f, indent=1, sort_keys=True)
+        print('Saved the baseline to ' + args.baseline + '.')
+    if regressions:
+        print(str(len(regressions)) + ' cases are more than ' + '%.0f%%' % (args.threshold * 100)
+              + ' slower than the baseline: ' + ', '.join(regressions))
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# Times how long automate_cron.py takes to start for commands that don't
+# need crontab, billing or numpy, against importing those eagerly as every
+# run used to.
+#
+#   python benchmarks/bench_startup.py [-n RUNS]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(os.path.dirname(HERE), 'automate_cron.py')
+
+CASES = [
+    ('python -c pass', [sys.executable, '-c', 'pass']),
+    ('eager imports (old startup)', [sys.executable, '-c', 'import crontab, numpy, billing']),
+    ('automate_cron.py --help', [sys.executable, SCRIPT, '--help']),
+    ('automate_cron.py preview', [sys.executable, SCRIPT, 'preview', '0 5 * * 1-5', '-n', '1']),
+    ('automate_cron.py env (cached)', [sys.executable, SCRIPT, 'env']),
+]
+
+
+def time_command(command, runs):
+    # Median wall time in ms, or None when the command fails.
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter() - started) * 1000)
+        if result.returncode != 0:
+            return None
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time automate_cron.py startup.')
+    parser.add_argument('-n', '--runs', type=int, default=10, help='runs per command')
+    args = parser.parse_args()
+
+    # The first env run fills the user cache if it is empty.
+    subprocess.run([sys.executable, SCRIPT, 'env'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    for name, command in CASES:
+        ms = time_command(command, args.runs)
+        print('%-32s %s' % (name, 'failed (missing module?)' if ms is None else '%7.1f ms' % ms))
+
+
+if __name__ == '__main__':
+    main()
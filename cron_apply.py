@@ -0,0 +1,265 @@
+import bisect
+import collections
+import difflib
+import fcntl
+import getpass
+import hashlib
+import os
+
+import cron_backup
+from cron_jobs import DISPATCHED, entry_span, make_title, parse_crontab, render_entry, render_line
+from cron_runs import SHARED_DIR, shared_dir
+from cron_schedule import compile_schedule
+from cron_timing import phase
+
+# A lock per crontab is held from the last read of it until it is
+# installed, so two runs on a host can't both pass the check and then both
+# write. It is kept in SHARED_DIR so runs from every account take the same
+# one.
+LOCK_DIR = SHARED_DIR
+BULK_EDITS = ('remove', 'retime', 'disable', 'enable', 'dispatch')
+
+
+class ConflictError(Exception):
+    # conflicts is a list of (base lines, our lines, their lines), one per
+    # place where our edit and someone else's touched the same lines.
+
+    def __init__(self, conflicts):
+        Exception.__init__(self, str(len(conflicts)) + ' conflicting change(s) to the crontab')
+        self.conflicts = conflicts
+
+    def report(self):
+        lines = ['The crontab was changed by someone else since it was loaded, and their changes overlap ours.',
+                 'Nothing was written. Re-run to start from the current crontab.']
+        for base, ours, theirs in self.conflicts:
+            lines.append('')
+            lines.append('  was:')
+            lines.extend('    ' + line for line in base or ['(nothing)'])
+            lines.append('  ours:')
+            lines.extend('    ' + line for line in ours or ['(removed)'])
+            lines.append('  theirs (now in the crontab):')
+            lines.extend('    ' + line for line in theirs or ['(removed)'])
+        return '\n'.join(lines)
+
+
+def fingerprint(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def join_lines(lines):
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def lock_path(user=None):
+    return os.path.join(LOCK_DIR, 'crontab.' + (user or getpass.getuser()) + '.lock')
+
+
+def locked(user=None):
+    # Takes the lock of user's crontab, the invoking user's when None, and
+    # returns the file holding it. Opened read only, which flock() allows,
+    # so any account can use a lock file another one created.
+    if LOCK_DIR == SHARED_DIR:
+        shared_dir()
+    else:
+        os.makedirs(LOCK_DIR, exist_ok=True)
+    fd = os.open(lock_path(user), os.O_RDONLY | os.O_CREAT, 0o666)
+    try:
+        os.fchmod(fd, 0o666)
+    except OSError:
+        pass
+    lock = os.fdopen(fd)
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    return lock
+
+
+def hunks(old, new):
+    # [(first, end, lines)]: old[first:end] is replaced by lines to get new.
+    # difflib slows down badly with many scattered changes, so lines found
+    # once in both (every title is) are matched up first, as patience diff
+    # does, and difflib only compares the gaps between them.
+    result = []
+    i0 = j0 = 0
+    for i, j in anchors(old, new) + [(len(old), len(new))]:
+        if i > i0 or j > j0:
+            matcher = difflib.SequenceMatcher(None, old[i0:i], new[j0:j], autojunk=False)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                if tag != 'equal':
+                    result.append((i0 + i1, i0 + i2, new[j0 + j1:j0 + j2]))
+        i0, j0 = i + 1, j + 1
+    return result
+
+
+def anchors(old, new):
+    # [(i, j)] where old[i] == new[j] is a line found once in each, the
+    # longest run of them in the same order in both.
+    old_counts = collections.Counter(old)
+    new_counts = collections.Counter(new)
+    where = dict((line, j) for j, line in enumerate(new) if new_counts[line] == 1)
+    pairs = [(i, where[line]) for i, line in enumerate(old) if old_counts[line] == 1 and line in where]
+
+    # Longest increasing run of j, by patience sorting.
+    tops = []
+    top_pairs = []
+    previous = [None] * len(pairs)
+    for n, (i, j) in enumerate(pairs):
+        pile = bisect.bisect_left(tops, j)
+        if pile == len(tops):
+            tops.append(j)
+            top_pairs.append(n)
+        else:
+            tops[pile] = j
+            top_pairs[pile] = n
+        previous[n] = top_pairs[pile - 1] if pile else None
+    run = []
+    n = top_pairs[-1] if top_pairs else None
+    while n is not None:
+        run.append(pairs[n])
+        n = previous[n]
+    run.reverse()
+    return run
+
+
+def overlaps(a, b):
+    # Two hunks of the same base conflict when they replace some of the same
+    # lines, or one inserts lines inside what the other replaces. Inserts at
+    # the same place don't conflict, both are kept.
+    if a[0] == a[1] and b[0] == b[1]:
+        return False
+    if a[0] == a[1]:
+        return b[0] < a[0] < b[1]
+    if b[0] == b[1]:
+        return a[0] < b[0] < a[1]
+    return a[0] < b[1] and b[0] < a[1]
+
+
+def merge(base, ours, theirs):
+    # Three way merge of lists of lines. Raises ConflictError when our
+    # changes to base and theirs overlap.
+    mine = hunks(base, ours)
+    other = hunks(base, theirs)
+    conflicts = [(base[a[0]:a[1]], a[2], b[2]) for a in mine for b in other if a != b and overlaps(a, b)]
+    if conflicts:
+        raise ConflictError(conflicts)
+
+    # Theirs go first where both insert at the same line. A change made on
+    # both sides is only applied once.
+    changes = [(h[0], h[1] != h[0], 0, h) for h in other]
+    changes += [(h[0], h[1] != h[0], 1, h) for h in mine if h not in other]
+    changes.sort(key=lambda change: change[:3])
+
+    merged = []
+    at = 0
+    for change in changes:
+        first, end, lines = change[3]
+        merged.extend(base[at:first])
+        merged.extend(lines)
+        at = max(at, end)
+    merged.extend(base[at:])
+    return merged
+
+
+def apply_edit(lines, request):
+    # lines with one add request, or one edit of a job by title. Raises
+    # ValueError, leaving lines as they were, when it can't be applied.
+    op = request['op']
+    entries = parse_crontab('\n'.join(lines))
+
+    if op == 'add':
+        # Every job in the request is added, or none are.
+        titles = set(entry.title for entry in entries if entry.title)
+        added = []
+        for job in request['jobs']:
+            title = str(job.get('title') or '').strip()
+            if not title:
+                raise ValueError('every job needs a title')
+            if title in titles:
+                raise ValueError('a job titled "' + title + '" already exists')
+            titles.add(title)
+            schedule = ' '.join(str(job['schedule']).split())
+            compile_schedule(schedule)
+            added.extend(render_entry(make_title(title), schedule, job['command']).splitlines())
+        return lines + added
+
+    title = str(request['title']).strip()
+    matches = [entry for entry in entries if entry.title == title]
+    if not matches:
+        raise ValueError('there is no job titled "' + title + '"')
+    if len(matches) > 1:
+        raise ValueError('more than one job is titled "' + title + '"')
+    entry = matches[0]
+
+    return bulk_edit(lines, [entry], op, request.get('schedule'))
+
+
+def bulk_edit(lines, entries, op, schedule=None):
+    # lines with op (remove, retime, disable, enable or dispatch) applied to
+    # each of entries, which were parsed from lines, in one pass.
+    if op not in BULK_EDITS:
+        raise ValueError('unknown edit "' + str(op) + '"')
+    if op == 'retime':
+        schedule = ' '.join(str(schedule or '').split())
+        compile_schedule(schedule)
+
+    dropped = set()
+    replaced = {}
+    for entry in entries:
+        if op == 'remove':
+            first, end = entry_span(lines, entry)
+            dropped.update(range(first, end))
+        elif op == 'retime':
+            replaced[entry.lineno] = render_line(entry, schedule=schedule)
+        elif op == 'dispatch':
+            replaced[entry.lineno] = DISPATCHED + render_line(entry, enabled=True)
+        else:
+            replaced[entry.lineno] = render_line(entry, enabled=op == 'enable')
+    return [replaced.get(n, line) for n, line in enumerate(lines) if n not in dropped]
+
+
+class Transaction(object):
+    # Edits to the crontab as it was when loaded. commit() writes them only
+    # if the crontab is unchanged, or someone else's changes since can be
+    # merged line by line without touching the same lines.
+
+    def __init__(self, text=None, user=None):
+        # user's crontab, the invoking user's when None.
+        self.user = user
+        self.base = cron_backup.current_crontab(user) if text is None else text
+        self.fingerprint = fingerprint(self.base)
+        self.lines = self.base.splitlines()
+        self.merged = False
+
+    def entries(self):
+        return parse_crontab(join_lines(self.lines))
+
+    def titles(self):
+        # Titles of the jobs in the loaded crontab, as make_title() gives them.
+        return set(make_title(entry.title) for entry in parse_crontab(self.base) if entry.title)
+
+    def edit(self, request):
+        self.lines = apply_edit(self.lines, request)
+
+    def edit_entries(self, entries, op, schedule=None):
+        # entries must be parsed from self.lines as they are now.
+        self.lines = bulk_edit(self.lines, entries, op, schedule)
+
+    def add(self, title, schedule, command):
+        self.edit({'op': 'add', 'jobs': [{'title': title, 'schedule': schedule, 'command': command}]})
+
+    def commit(self):
+        # Returns False when there was nothing to write. Raises
+        # ConflictError, having written nothing, on a conflict.
+        text = join_lines(self.lines)
+        if text == self.base:
+            return False
+        with locked(self.user):
+            current = cron_backup.current_crontab(self.user)
+            if fingerprint(current) != self.fingerprint:
+                with phase('merge'):
+                    text = join_lines(merge(self.base.splitlines(), self.lines, current.splitlines()))
+                self.merged = True
+            # crontab(1) swaps the new file in whole.
+            cron_backup.install_crontab(text, self.user)
+        self.base = text
+        self.fingerprint = fingerprint(text)
+        self.lines = text.splitlines()
+        return True
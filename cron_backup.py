@@ -0,0 +1,261 @@
+import bisect
+import collections
+import datetime
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import pwd
+import subprocess
+import tempfile
+import time
+
+from cron_jobs import entry_key, parse_crontab
+from cron_timing import phase
+
+# Every snapshot is kept for KEEP_ALL_DAYS, then the last one of each day
+# until KEEP_DAILY_DAYS, then the last one of each month.
+KEEP_ALL_DAYS = 7
+KEEP_DAILY_DAYS = 90
+
+Snapshot = collections.namedtuple('Snapshot', 'time digest size')
+
+
+def user_args(user):
+    # ['-u', user] when user's crontab is not the invoking user's own. Some
+    # crontab(1)s refuse -u for yourself, so as python-crontab does it is
+    # only given when needed.
+    if user and user != pwd.getpwuid(os.getuid())[0]:
+        return ['-u', user]
+    return []
+
+
+def current_crontab(user=None):
+    # user's crontab text, or the invoking user's when user is None.
+    with phase('crontab_read'):
+        result = subprocess.run(['crontab'] + user_args(user) + ['-l'], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+    if result.returncode != 0:
+        if 'no crontab' in result.stderr:
+            return ''
+        raise OSError('crontab -l failed: ' + result.stderr.strip())
+    return result.stdout
+
+
+class BackupStore(object):
+    # Snapshots live in objects/<sha256>.gz, one file per distinct crontab,
+    # and the "index" file lists "<epoch> <sha256> <size>" per snapshot in
+    # time order.
+
+    def __init__(self, path):
+        self.path = path
+        self.objects = os.path.join(path, 'objects')
+        self.index_path = os.path.join(path, 'index')
+        self._index = None
+        self._times = None
+        self._index_mtime = None
+
+    def object_path(self, digest):
+        return os.path.join(self.objects, digest + '.gz')
+
+    def _lock(self):
+        os.makedirs(self.objects, exist_ok=True)
+        lock = open(os.path.join(self.path, '.lock'), 'w')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def snapshots(self):
+        # Cached until the index file changes on disk.
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        if self._index is None or mtime != self._index_mtime:
+            index = []
+            with open(self.index_path) as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) == 3:
+                        index.append(Snapshot(int(fields[0]), fields[1], int(fields[2])))
+            index.sort(key=lambda s: s.time)
+            self._index = index
+            self._times = [s.time for s in index]
+            self._index_mtime = mtime
+        return self._index
+
+    def latest(self):
+        snapshots = self.snapshots()
+        return snapshots[-1] if snapshots else None
+
+    def at(self, when):
+        # The snapshot that was current at `when` (a datetime or epoch).
+        if isinstance(when, datetime.datetime):
+            when = when.timestamp()
+        snapshots = self.snapshots()
+        n = bisect.bisect_right(self._times or [], when)
+        return snapshots[n - 1] if n else None
+
+    def read(self, digest):
+        with gzip.open(self.object_path(digest), 'rt') as f:
+            return f.read()
+
+    def jobs(self, digest):
+        # {job key: line} for a snapshot. Objects never change, so this is
+        # parsed once and kept next to the object.
+        path = os.path.join(self.objects, digest + '.jobs')
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass
+
+        jobs = job_lines(self.read(digest))
+        tmp = path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(jobs, f)
+            os.replace(tmp, path)
+        except OSError:
+            # Read-only backups are still usable, just slower.
+            pass
+        return jobs
+
+    def resolve(self, ref):
+        # A snapshot from a history number (0 is the oldest, -1 the newest),
+        # a digest prefix, or a YYYYMMDD[HHMM[SS]] time.
+        snapshots = self.snapshots()
+        if not snapshots:
+            raise LookupError('There are no backups yet.')
+        if ref.lstrip('-').isdigit() and len(ref.lstrip('-')) < 8:
+            try:
+                return snapshots[int(ref)]
+            except IndexError:
+                raise LookupError('There are only ' + str(len(snapshots)) + ' backups.')
+        if ref.isdigit():
+            fmt = {8: '%Y%m%d', 12: '%Y%m%d%H%M', 14: '%Y%m%d%H%M%S'}.get(len(ref))
+            if fmt:
+                when = datetime.datetime.strptime(ref, fmt)
+                if len(ref) == 8:
+                    when += datetime.timedelta(days=1, seconds=-1)
+                snapshot = self.at(when)
+                if snapshot is None:
+                    raise LookupError('There is no backup from before ' + ref + '.')
+                return snapshot
+        matches = set(s.digest for s in snapshots if s.digest.startswith(ref.lower()))
+        if len(matches) == 1:
+            digest = matches.pop()
+            return [s for s in snapshots if s.digest == digest][-1]
+        if matches:
+            raise LookupError('"' + ref + '" matches more than one backup.')
+        raise LookupError('No backup matches "' + ref + '".')
+
+    def snapshot(self, text, now=None):
+        # Records text as the current crontab. Returns (Snapshot, created)
+        # where created is False when it matches the latest snapshot.
+        data = text.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        now = int(time.time() if now is None else now)
+
+        with self._lock():
+            latest = self.latest()
+            if latest is not None and latest.digest == digest:
+                return latest, False
+
+            path = self.object_path(digest)
+            if not os.path.exists(path):
+                tmp = path + '.tmp'
+                with gzip.open(tmp, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, path)
+
+            snapshot = Snapshot(now, digest, len(data))
+            with open(self.index_path, 'a') as f:
+                f.write(str(snapshot.time) + ' ' + digest + ' ' + str(snapshot.size) + '\n')
+            # mtime is too coarse on NFS to notice our own append.
+            self._index = None
+
+            self._prune(now)
+        return snapshot, True
+
+    def _prune(self, now):
+        snapshots = self.snapshots()
+        keep = retained(snapshots, now)
+        if len(keep) == len(snapshots):
+            return
+
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w') as f:
+            for s in keep:
+                f.write(str(s.time) + ' ' + s.digest + ' ' + str(s.size) + '\n')
+        os.replace(tmp, self.index_path)
+        self._index = None
+
+        used = set(s.digest for s in keep)
+        for s in snapshots:
+            if s.digest not in used:
+                used.add(s.digest)
+                for path in (self.object_path(s.digest), os.path.join(self.objects, s.digest + '.jobs')):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+
+def retained(snapshots, now):
+    # Applies the KEEP_* policy to time ordered snapshots.
+    keep_all = now - KEEP_ALL_DAYS * 86400
+    keep_daily = now - KEEP_DAILY_DAYS * 86400
+    keep = []
+    last_bucket = None
+    # Walk newest first so the last snapshot of each day/month wins.
+    for s in reversed(snapshots):
+        if s.time >= keep_all:
+            keep.append(s)
+            continue
+        day = datetime.date.fromtimestamp(s.time)
+        bucket = day if s.time >= keep_daily else (day.year, day.month)
+        if bucket != last_bucket:
+            keep.append(s)
+            last_bucket = bucket
+    keep.reverse()
+    return keep
+
+
+def job_lines(text):
+    jobs = {}
+    for entry in parse_crontab(text):
+        key = entry_key(entry)
+        # Keep repeated titles apart rather than letting one hide the other.
+        n = 2
+        unique = key
+        while unique in jobs:
+            unique = key + ' (' + str(n) + ')'
+            n += 1
+        jobs[unique] = entry.line.strip()
+    return jobs
+
+
+def diff_jobs(old, new):
+    # (added, removed, changed) between two {key: line} maps. changed is a
+    # list of (key, old line, new line).
+    added = [(key, new[key]) for key in new if key not in old]
+    removed = [(key, old[key]) for key in old if key not in new]
+    changed = [(key, old[key], new[key]) for key in new if key in old and old[key] != new[key]]
+    return added, removed, changed
+
+
+def install_crontab(text, user=None):
+    # crontab(1) swaps the whole file in, so a partly written crontab is
+    # never live.
+    with tempfile.NamedTemporaryFile('w', prefix='crontab.', suffix='.restore', delete=False) as f:
+        f.write(text)
+        path = f.name
+    try:
+        with phase('crontab_install'):
+            result = subprocess.run(['crontab'] + user_args(user) + [path], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    universal_newlines=True)
+    finally:
+        os.remove(path)
+    if result.returncode != 0:
+        raise OSError('crontab failed: ' + result.stderr.strip())
@@ -0,0 +1,247 @@
+import getpass
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from concurrent.futures import Future
+
+import cron_backup
+from cron_apply import apply_edit, join_lines, locked
+from cron_jobs import parse_crontab
+from cron_runs import SHARED_DIR, shared_dir
+
+# Where cron keeps each user's crontab. When the file can be stat'ed its
+# mtime says when the crontab needs reading again, otherwise it is read
+# before every request.
+SPOOL_DIRS = ('/var/spool/cron/crontabs', '/var/spool/cron', '/var/cron/tabs')
+# Seconds a client waits for an answer.
+CLIENT_TIMEOUT = 60
+EDITS = ('add', 'remove', 'retime', 'disable', 'enable')
+
+
+class DaemonError(Exception):
+    pass
+
+
+def socket_path(user=None):
+    # One daemon per crontab, found by every account that edits it.
+    return os.path.join(SHARED_DIR, 'daemon.' + (user or getpass.getuser()) + '.sock')
+
+
+def check_request(request):
+    # Raises ValueError when an edit request is not shaped as the README
+    # describes, before it reaches the writer thread.
+    op = request.get('op')
+    if op == 'add':
+        jobs = request.get('jobs')
+        if not isinstance(jobs, list) or not jobs:
+            raise ValueError('"jobs" must be a list of jobs')
+        for job in jobs:
+            if not isinstance(job, dict):
+                raise ValueError('each job must be a JSON object')
+            for key in ('title', 'schedule', 'command'):
+                if not isinstance(job.get(key), str):
+                    raise ValueError('each job needs a "' + key + '" string')
+        return
+    if not isinstance(request.get('title'), str):
+        raise ValueError('"' + op + '" needs a "title" string')
+    if op == 'retime' and not isinstance(request.get('schedule'), str):
+        raise ValueError('"retime" needs a "schedule" string')
+
+
+def spool_mtime(user):
+    for directory in SPOOL_DIRS:
+        try:
+            return os.stat(os.path.join(directory, user)).st_mtime_ns
+        except OSError:
+            pass
+    return None
+
+
+class CrontabDaemon(object):
+    # Keeps the user's crontab in memory and makes every change to it from
+    # one writer thread. Edits that arrive while a write is under way are
+    # applied together, with one read and one write for the lot.
+
+    def __init__(self, user=None):
+        self.user = user or getpass.getuser()
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.text = None
+        self.entries = []
+        self.mtime = None
+        self.reloads = 0
+        self.writes = 0
+
+    def refresh(self, force=False):
+        # Re-reads the crontab when it may have changed. Call with the lock.
+        mtime = spool_mtime(self.user)
+        if force or self.text is None or mtime is None or mtime != self.mtime:
+            self.text = cron_backup.current_crontab(self.user)
+            self.entries = parse_crontab(self.text)
+            self.mtime = mtime
+            self.reloads += 1
+
+    def handle(self, request):
+        op = request.get('op')
+        if op == 'ping':
+            return {'ok': True, 'pid': os.getpid(), 'user': self.user, 'reloads': self.reloads, 'writes': self.writes}
+        # A client working on another user's crontab must not edit this one.
+        if request.get('user') not in (None, self.user):
+            return {'ok': False, 'error': 'this daemon edits the crontab of ' + self.user + ', not '
+                    + str(request.get('user'))}
+        if op in ('list', 'reload'):
+            with self.lock:
+                self.refresh(force=op == 'reload')
+                entries = self.entries
+            return {'ok': True, 'jobs': [
+                {'title': e.title, 'schedule': e.schedule, 'command': e.command, 'enabled': e.enabled}
+                for e in entries]}
+        if op in EDITS:
+            check_request(request)
+            future = Future()
+            self.queue.put((request, future))
+            return future.result()
+        return {'ok': False, 'error': 'unknown op ' + json.dumps(op)}
+
+    def writer(self):
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.apply(batch)
+            except Exception as e:
+                # Whatever went wrong, the writer keeps going and nobody is
+                # left waiting for an answer.
+                for request, future in batch:
+                    if not future.done():
+                        future.set_result({'ok': False, 'error': str(e) or e.__class__.__name__})
+
+    def apply(self, batch):
+        # Also takes the lock Transaction.commit() holds, so a walk-through
+        # run without the daemon can't write in between the read and write.
+        with self.lock, locked(self.user):
+            try:
+                self.refresh()
+            except OSError as e:
+                for request, future in batch:
+                    future.set_result({'ok': False, 'error': str(e)})
+                return
+
+            lines = self.text.splitlines()
+            done = []
+            for request, future in batch:
+                try:
+                    lines = apply_edit(lines, request)
+                    done.append(future)
+                except Exception as e:
+                    future.set_result({'ok': False, 'error': str(e) or e.__class__.__name__})
+
+            text = join_lines(lines)
+            if done and text != self.text:
+                try:
+                    cron_backup.install_crontab(text, self.user)
+                except OSError as e:
+                    for future in done:
+                        future.set_result({'ok': False, 'error': str(e)})
+                    return
+                self.text = text
+                self.entries = parse_crontab(text)
+                self.mtime = spool_mtime(self.user)
+                self.writes += 1
+
+        for future in done:
+            future.set_result({'ok': True})
+
+
+class Handler(socketserver.StreamRequestHandler):
+    # One JSON request per line, answered with one JSON line.
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+                if not isinstance(request, dict):
+                    raise ValueError('a request must be a JSON object')
+                response = self.server.service.handle(request)
+            except ValueError as e:
+                response = {'ok': False, 'error': str(e)}
+            self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Clients get EAGAIN rather than waiting when the backlog is full.
+    request_queue_size = 128
+
+
+def serve(path=None, user=None):
+    # Serves edits to user's crontab, the invoking user's when None.
+    path = path or socket_path(user)
+    if running(path):
+        raise DaemonError('a daemon is already listening on ' + path)
+    if os.path.dirname(path) == SHARED_DIR:
+        shared_dir()
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except PermissionError:
+        raise DaemonError(path + ' was left by another account, which has to remove it')
+
+    service = CrontabDaemon(user)
+    threading.Thread(target=service.writer, daemon=True).start()
+    # Only this account and its group may talk to it, so operators who
+    # share the crontab need to share the daemon's group.
+    umask = os.umask(0o007)
+    try:
+        server = Server(path, Handler)
+    finally:
+        os.umask(umask)
+    server.service = service
+    # Clean up the socket when stopped with kill as well as ctrl-c.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(path)
+
+
+def call(request, path, timeout=CLIENT_TIMEOUT):
+    # The daemon's response, raising DaemonError when the request failed and
+    # OSError when no daemon is listening.
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise DaemonError('the daemon closed the connection')
+    response = json.loads(line.decode('utf-8'))
+    if not response.get('ok'):
+        raise DaemonError(response.get('error') or 'request failed')
+    return response
+
+
+def running(path):
+    # Raises DaemonError when a daemon is there but this account may not
+    # use it, rather than have edits go around it.
+    try:
+        call({'op': 'ping'}, path, timeout=2)
+        return True
+    except PermissionError:
+        raise DaemonError('a daemon is listening on ' + path + ' but this account may not talk to it')
+    except (OSError, ValueError, DaemonError):
+        return False
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# Runs every job the crontab marks "#dispatched:" for one schedule, at most
+# --workers at a time, in place of cron starting them all in the same
+# minute. Each job's command runs through /bin/sh as cron would run it, so
+# its ">> log 2>&1" still writes the job's own log.
+import argparse
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cron_backup
+from cron_jobs import is_dispatched, parse_crontab, script_from_command
+
+DEFAULT_WORKERS = 4
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run the dispatched jobs of one cron schedule.')
+    parser.add_argument('--schedule', required=True, help='schedule whose dispatched jobs to run')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='jobs to run at once')
+    return parser.parse_args(argv)
+
+
+def members(text, schedule):
+    return [entry for entry in parse_crontab(text) if is_dispatched(entry) and entry.schedule == schedule]
+
+
+def cron_command(command):
+    # cron passes "\%" on as "%".
+    return command.replace('\\%', '%')
+
+
+def run_member(entry):
+    start = time.time()
+    try:
+        code = subprocess.call(['/bin/sh', '-c', cron_command(entry.command)])
+    except OSError as e:
+        sys.stderr.write('cron_dispatch: could not run ' + entry.command + ': ' + str(e) + '\n')
+        code = 127
+    return entry, code, time.time() - start
+
+
+def main():
+    args = parse_args()
+    schedule = ' '.join(args.schedule.split())
+    try:
+        jobs = members(cron_backup.current_crontab(), schedule)
+    except OSError as e:
+        sys.stderr.write('cron_dispatch: ' + str(e) + '\n')
+        sys.exit(1)
+
+    stamp = time.strftime('%Y-%m-%d %H:%M:%S')
+    sys.stdout.write(stamp + ' running ' + str(len(jobs)) + ' jobs for "' + schedule + '", '
+                     + str(args.workers) + ' at a time\n')
+    sys.stdout.flush()
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        for entry, code, seconds in pool.map(run_member, jobs):
+            if code != 0:
+                failed += 1
+            name = entry.title or script_from_command(entry.command)
+            sys.stdout.write('  ' + name + ': exit ' + str(code) + ' after ' + '%.1f' % seconds + 's\n')
+    sys.stdout.flush()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
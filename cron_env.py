@@ -0,0 +1,81 @@
+import json
+import os
+import socket
+import time
+
+from cron_runs import STATE_DIR
+
+# How long resolved users are trusted before billing is asked again.
+CACHE_TTL = int(os.environ.get('CRON_AUTOMATION_ENV_TTL', 24 * 3600))
+
+ENVIRONMENTS = {'p': 'PROD', 't': 'TEST', 'i': 'INT', 'd': 'DEV'}
+
+
+def short_hostname():
+    return socket.gethostname().split('.')[0]
+
+
+def environment_name(hostname):
+    # The last letter of the hostname says which environment it is in.
+    # TEST is the default server.
+    return ENVIRONMENTS.get(hostname[-1:], 'TEST')
+
+
+def cache_path(hostname):
+    return os.path.join(STATE_DIR, 'env_' + hostname + '.json')
+
+
+def load_users(hostname, ttl=CACHE_TTL):
+    # (rbmuser, billopsuser, cached at) from the cache, or None when there
+    # is no cache for hostname or it is older than ttl seconds.
+    try:
+        with open(cache_path(hostname)) as f:
+            cached = json.load(f)
+        users = (cached['rbmuser'], cached['billopsuser'], float(cached['time']))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if not 0 <= time.time() - users[2] < ttl:
+        return None
+    return users
+
+
+def save_users(hostname, rbmuser, billopsuser):
+    path = cache_path(hostname)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'rbmuser': rbmuser, 'billopsuser': billopsuser,
+                   'env': environment_name(hostname), 'time': time.time()}, f)
+    os.replace(tmp, path)
+
+
+def clear_users(hostname):
+    # Returns True when there was a cache to remove.
+    try:
+        os.remove(cache_path(hostname))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def resolve_users(hostname=None, ttl=CACHE_TTL, refresh=False):
+    # (rbmuser, billopsuser) for hostname. billing is slow to import and to
+    # build an Environment from, so it is only asked when the cache is
+    # missing, expired or refresh is set.
+    hostname = hostname or short_hostname()
+    if not refresh:
+        cached = load_users(hostname, ttl)
+        if cached is not None:
+            return cached[0], cached[1]
+
+    from billing import Environment
+    env = Environment(env=environment_name(hostname))
+    rbmuser = str(env.servers['rbmuser'])
+    billopsuser = str(env.servers['billopsuser'])
+
+    try:
+        save_users(hostname, rbmuser, billopsuser)
+    except OSError:
+        # Still usable without a cache, just slower next time.
+        pass
+    return rbmuser, billopsuser
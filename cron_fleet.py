@@ -0,0 +1,197 @@
+import collections
+import os
+import re
+import shlex
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cron_env
+from cron_jobs import build_command, make_title, parse_crontab, render_entry
+
+# One hostname per line, used to pick the hosts of an environment.
+DEFAULT_HOSTS_FILE = os.environ.get('CRON_AUTOMATION_HOSTS', os.path.expanduser('~/.cron_automation_hosts'))
+# Hosts worked on at once.
+DEFAULT_WORKERS = 8
+SSH_OPTIONS = ('-o', 'BatchMode=yes', '-o', 'ConnectTimeout=10')
+# Seconds one ssh command may take before the host is given up on.
+SSH_TIMEOUT = 60
+# Also keeps a host from being read as an ssh option or a path.
+HOST_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9.-]*$')
+# Where each host keeps a copy of the crontab as it was before every
+# write, relative to the user's home directory there.
+REMOTE_BACKUP_DIR = '.cron_automation/crontab_backups'
+
+# added and existing are lists of job titles; error is None when the host
+# was updated (or would have been, in a dry run).
+HostResult = collections.namedtuple('HostResult', 'host env added existing error')
+
+
+class SSHTransport(object):
+    # Reads and installs a user's crontab on a host with ssh and crontab(1).
+
+    def __init__(self, ssh='ssh', options=SSH_OPTIONS, timeout=SSH_TIMEOUT):
+        self.ssh = ssh
+        self.options = list(options)
+        self.timeout = timeout
+
+    def _run(self, host, user, command, text=None):
+        try:
+            return subprocess.run([self.ssh] + self.options + [user + '@' + host] + command, input=text,
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+                                  timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            raise OSError('timed out after ' + str(self.timeout) + 's')
+
+    def read(self, host, user):
+        result = self._run(host, user, ['crontab', '-l'])
+        if result.returncode != 0:
+            if 'no crontab' in result.stderr:
+                return ''
+            raise OSError('crontab -l failed: ' + result.stderr.strip())
+        return result.stdout
+
+    def write(self, host, user, text):
+        result = self._run(host, user, ['crontab', '-'], text)
+        if result.returncode != 0:
+            raise OSError('crontab failed: ' + result.stderr.strip())
+
+    def backup(self, host, user, text):
+        # Keeps text, the crontab about to be replaced, on the host.
+        path = REMOTE_BACKUP_DIR + '/crontab.' + time.strftime('%Y%m%d%H%M%S')
+        command = 'umask 077 && mkdir -p ' + shlex.quote(REMOTE_BACKUP_DIR) + ' && cat > ' + shlex.quote(path)
+        result = self._run(host, user, [command], text)
+        if result.returncode != 0:
+            raise OSError('could not back up the crontab: ' + result.stderr.strip())
+
+
+class LocalTransport(object):
+    # Stand-in for SSHTransport that keeps each crontab in
+    # <root>/<host>/<user>.crontab, to try a rollout without touching hosts.
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, host, user):
+        return os.path.join(self.root, host, user + '.crontab')
+
+    def read(self, host, user):
+        try:
+            with open(self.path(host, user)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return ''
+
+    def write(self, host, user, text):
+        path = self.path(host, user)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def backup(self, host, user, text):
+        path = os.path.join(self.root, host, REMOTE_BACKUP_DIR, user + '.crontab.' + time.strftime('%Y%m%d%H%M%S'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+
+
+def load_hosts(path=DEFAULT_HOSTS_FILE):
+    hosts = []
+    with open(path) as f:
+        for line in f:
+            host = line.split('#')[0].strip()
+            if host:
+                hosts.append(host)
+    return hosts
+
+
+def short_name(host):
+    return host.split('.')[0]
+
+
+def select_hosts(hosts, env):
+    # The hosts of one environment class (PROD, TEST, INT or DEV).
+    return [host for host in hosts if cron_env.environment_name(short_name(host)) == env]
+
+
+def new_jobs(text, valid, billopsuser, record_runs=False, runner=None):
+    # (added, existing, crontab lines to append) for the rows of valid
+    # against the crontab text of one host.
+    titles = set(make_title(entry.title) for entry in parse_crontab(text) if entry.title)
+    added = []
+    existing = []
+    lines = []
+    for number, spec in valid:
+        if spec['title'] in titles:
+            existing.append(spec['title'])
+            continue
+        command = build_command(billopsuser, spec['directory'], spec['ksh'], record_runs, spec['overlap'], runner)
+        lines.append(render_entry(spec['title'], spec['schedule'], command))
+        added.append(spec['title'])
+    return added, existing, lines
+
+
+def apply_host(transport, host, users, valid, record_runs=False, dry_run=False, runner=None):
+    # Adds every validated manifest row whose title is not already on host
+    # in one crontab write. Never raises, failures go in the result.
+    env = cron_env.environment_name(short_name(host))
+    try:
+        rbmuser, billopsuser = users
+        text = transport.read(host, rbmuser)
+        added, existing, lines = new_jobs(text, valid, billopsuser, record_runs, runner)
+
+        if lines and not dry_run:
+            transport.backup(host, rbmuser, text)
+            # There is no lock across hosts, so read again right before the
+            # write and start over from what is there if someone else
+            # changed it since, rather than overwrite their change.
+            current = transport.read(host, rbmuser)
+            if current != text:
+                transport.backup(host, rbmuser, current)
+                text = current
+                added, existing, lines = new_jobs(text, valid, billopsuser, record_runs, runner)
+            if lines:
+                if text and not text.endswith('\n'):
+                    text += '\n'
+                transport.write(host, rbmuser, text + ''.join(lines))
+        return HostResult(host, env, added, existing, None)
+    except Exception as e:
+        return HostResult(host, env, [], [], str(e) or e.__class__.__name__)
+
+
+def needs_runner(valid, record_runs=False):
+    # Whether the jobs run through cron_runner.py, whose path on the hosts
+    # this checkout's can't stand in for.
+    return record_runs or any(spec['overlap'] for number, spec in valid)
+
+
+def apply_fleet(transport, hosts, valid, record_runs=False, dry_run=False, workers=DEFAULT_WORKERS, runner=None):
+    # HostResult per host, in the order given. runner is how the hosts call
+    # cron_runner.py; ValueError when needs_runner() and it is not given.
+    if needs_runner(valid, record_runs) and not runner:
+        raise ValueError('--record-runs and rows with an overlap policy need --runner, the command that runs '
+                         'cron_runner.py on the hosts.')
+    # Users are resolved up front, one host at a time, as billing may not
+    # be safe to use from several threads.
+    users = {}
+    failed = {}
+    for host in hosts:
+        if not HOST_RE.match(host):
+            failed[host] = HostResult(host, '', [], [], 'invalid host name')
+            continue
+        try:
+            users[host] = cron_env.resolve_users(short_name(host))
+        except Exception as e:
+            failed[host] = HostResult(host, cron_env.environment_name(short_name(host)), [], [],
+                                      'could not resolve users: ' + str(e))
+
+    todo = [host for host in hosts if host not in failed]
+    results = dict(failed)
+    if todo:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(todo)))) as pool:
+            for result in pool.map(lambda host: apply_host(transport, host, users[host], valid, record_runs, dry_run,
+                                                           runner), todo):
+                results[result.host] = result
+    return [results[host] for host in hosts]
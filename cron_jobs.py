@@ -0,0 +1,193 @@
+import collections
+import os
+import re
+import sys
+
+HOME_DIRS = '/usr/local/rbm/home_dirs/'
+TITLE_PREFIX = '====== '
+# Starts the line of a job that cron_dispatch.py runs instead of cron.
+DISPATCHED = '#dispatched: '
+
+TITLE_RE = re.compile(r'^#\s*(={3,})\s*(.*?)\s*$')
+ENV_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*\s*=')
+JOB_RE = re.compile(r'^(@\w+|(?:\S+\s+){4}\S+)\s+(.+)$')
+
+# One cron job line as read from crontab text. title is the text of the
+# "#====== title" line right above it, or '' when there is none.
+Entry = collections.namedtuple('Entry', 'title schedule command enabled lineno line')
+
+
+def bin_dir(billopsuser):
+    return HOME_DIRS + billopsuser + '/bin'
+
+
+def log_dir(billopsuser):
+    return HOME_DIRS + billopsuser + '/log'
+
+
+def script_path(billopsuser, directory_name, ksh_name):
+    return bin_dir(billopsuser) + '/' + directory_name + '/' + ksh_name
+
+
+def runner_command():
+    # How crontab lines call cron_runner.py, which sits next to this file.
+    here = os.path.dirname(os.path.abspath(__file__))
+    return sys.executable + ' ' + os.path.join(here, 'cron_runner.py')
+
+
+def build_command(billopsuser, directory_name, ksh_name, record_runs=False, overlap=None, runner=None):
+    # overlap is one of cron_runs.OVERLAP_POLICIES and implies record_runs.
+    # runner is how the crontab's host calls cron_runner.py, this host's
+    # runner_command() by default.
+    runner = runner or runner_command()
+    script_to_run = ' ' + script_path(billopsuser, directory_name, ksh_name)
+    if overlap:
+        script_to_run = ' ' + runner + ' --single-instance ' + overlap + script_to_run
+    elif record_runs:
+        script_to_run = ' ' + runner + script_to_run
+    log_file = ' >> ' + log_dir(billopsuser) + '/' + ksh_name[:-4] + '_`hostname`_`date +%Y%m%d`.log 2>&1'
+    return script_to_run + log_file
+
+
+def script_from_command(command):
+    # The script a command built by build_command() runs: the first .ksh
+    # before any redirect, else the first word.
+    words = command.split('>')[0].split()
+    scripts = [word for word in words if word.endswith('.ksh')]
+    return scripts[0] if scripts else (words or [''])[0]
+
+
+def ksh_from_command(command):
+    # "x.ksh" -> "x" for a command built by build_command(), matching the
+    # <ksh>_<hostname>_<date>.log naming.
+    name = os.path.basename(script_from_command(command))
+    if name.endswith('.ksh'):
+        name = name[:-4]
+    return name
+
+
+def render_entry(title, schedule, command):
+    # Crontab text for a new job as python-crontab writes it: the title on
+    # its own line above the job, and % escaped so cron passes it through.
+    return '# ' + title + '\n' + schedule + ' ' + command.strip().replace('%', '\\%') + '\n'
+
+
+def make_title(title_name):
+    return TITLE_PREFIX + title_name
+
+
+def clean_directory_name(directory_name):
+    # Same rules the walk-through applies to the directory name.
+    directory_name = directory_name.strip()
+    if len(directory_name) == 0:
+        raise ValueError('Directory name cannot be empty.')
+    if len(directory_name.split(' ')) > 1:
+        raise ValueError("Please don't include any spaces in the directory name.")
+    if directory_name[0] == '/':
+        directory_name = directory_name[1:]
+    return directory_name
+
+
+def clean_ksh_name(ksh_name):
+    # Same rules the walk-through applies to the .ksh name.
+    ksh_name = os.path.basename(ksh_name.strip())
+    parts = ksh_name.split('.')
+    if len(parts[0]) == 0:
+        raise ValueError('Name cannot be empty.')
+    if len(parts) > 2:
+        raise ValueError('Name cannot have more than 1 dot in name.')
+    return parts[0] + '.ksh'
+
+
+def parse_entry(line, lineno=0, title=''):
+    # Entry for a job line (including one disabled with "#"), else None.
+    text = line.strip()
+    enabled = True
+    if text.startswith('#'):
+        enabled = False
+        if text.startswith(DISPATCHED):
+            text = text[len(DISPATCHED):]
+        text = text.lstrip('#').strip()
+    if not text or ENV_RE.match(text):
+        return None
+    match = JOB_RE.match(text)
+    if not match:
+        return None
+    schedule = ' '.join(match.group(1).split())
+    if not enabled and not (schedule.startswith('@') or schedule.split(' ')[0][:1] in '0123456789*'):
+        # An ordinary comment that happens to have 6+ words.
+        return None
+    return Entry(title, schedule, match.group(2).strip(), enabled, lineno, line)
+
+
+def parse_crontab(text):
+    # Entries for every job in crontab text, keeping the title comments
+    # that python-crontab does not read back.
+    entries = []
+    title = ''
+    for lineno, line in enumerate(text.splitlines()):
+        match = TITLE_RE.match(line.strip())
+        if match:
+            title = match.group(2)
+            continue
+        entry = parse_entry(line, lineno, title)
+        if entry is not None:
+            entries.append(entry)
+        if line.strip():
+            title = ''
+    return entries
+
+
+def is_dispatched(entry):
+    return entry.line.lstrip().startswith(DISPATCHED)
+
+
+def is_dispatcher(entry):
+    # The cron_dispatch.py entry that runs the dispatched jobs of its
+    # schedule, rather than a job of its own.
+    return entry.enabled and entry.title == dispatch_title(entry.schedule)
+
+
+def render_line(entry, schedule=None, enabled=None):
+    # entry's job line, with a new schedule and/or enabled state. A
+    # dispatched job stays dispatched unless enabled is given, or it is
+    # moved to another schedule: its dispatcher only runs the old one, so
+    # it goes back to cron.
+    line = (schedule or entry.schedule) + ' ' + entry.command
+    if enabled is None:
+        if is_dispatched(entry):
+            moved = schedule and schedule != entry.schedule
+            return line if moved else DISPATCHED + line
+        enabled = entry.enabled
+    return line if enabled else '# ' + line
+
+
+def dispatch_title(schedule):
+    return 'dispatch ' + schedule
+
+
+def dispatch_command(billopsuser, schedule, workers):
+    # The cron_dispatch.py entry that runs the dispatched jobs of schedule.
+    here = os.path.dirname(os.path.abspath(__file__))
+    return (sys.executable + ' ' + os.path.join(here, 'cron_dispatch.py') + ' --workers ' + str(workers)
+            + ' --schedule "' + schedule + '" >> ' + log_dir(billopsuser) + '/dispatch_`hostname`_`date +%Y%m%d`.log 2>&1')
+
+
+def entry_span(lines, entry):
+    # (first, end) line numbers of entry in the lines it was parsed from,
+    # taking in its title comment when it has one.
+    first = entry.lineno
+    if entry.title:
+        n = entry.lineno - 1
+        while n >= 0 and not lines[n].strip():
+            n -= 1
+        if n >= 0 and TITLE_RE.match(lines[n].strip()):
+            first = n
+    return first, entry.lineno + 1
+
+
+def entry_key(entry):
+    # What identifies a job between two versions of a crontab.
+    if entry.title:
+        return entry.title
+    return entry.command
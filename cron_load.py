@@ -0,0 +1,147 @@
+import calendar
+import datetime
+
+import numpy as np
+
+from cron_jobs import is_dispatched, is_dispatcher
+from cron_schedule import compile_schedule
+
+MINUTES_PER_DAY = 1440
+
+
+def job_label(entry):
+    if entry.title:
+        return entry.title
+    # No title, the script path is the next best name.
+    return entry.command.split('>')[0].strip()
+
+
+def crontab_schedules(entries):
+    # (entry, Schedule) for every parse_crontab() entry that can actually
+    # fire. Dispatched jobs still run on their schedule, through their
+    # dispatcher entry, which is left out as it runs no job of its own.
+    schedules = []
+    for entry in entries:
+        if is_dispatcher(entry) or not (entry.enabled or is_dispatched(entry)):
+            continue
+        try:
+            schedule = compile_schedule(entry.schedule)
+        except ValueError:
+            continue
+        if not schedule.never:
+            schedules.append((entry, schedule))
+    return schedules
+
+
+def week_period(day):
+    # The Monday-Sunday week containing day.
+    start = day - datetime.timedelta(days=day.weekday())
+    return start, 7
+
+
+def month_period(day):
+    return day.replace(day=1), calendar.monthrange(day.year, day.month)[1]
+
+
+def _bits(values, width):
+    # Row per bitset, column per value.
+    values = np.array(values, dtype=np.int64)[:, None]
+    return (values >> np.arange(width, dtype=np.int64)[None, :]) & 1 == 1
+
+
+def occupancy(schedules, start, days):
+    # Bool matrix with a row per schedule and a column per minute of the
+    # period starting at midnight of `start`; True where the job starts.
+    if not schedules:
+        return np.zeros((0, days * MINUTES_PER_DAY), dtype=bool)
+
+    minutes = _bits([s.minutes for s in schedules], 60)
+    hours = _bits([s.hours for s in schedules], 24)
+    day_minutes = (hours[:, :, None] & minutes[:, None, :]).reshape(len(schedules), MINUTES_PER_DAY)
+    day_match = day_matches(schedules, start, days)
+
+    return (day_match[:, :, None] & day_minutes[:, None, :]).reshape(len(schedules), days * MINUTES_PER_DAY)
+
+
+def day_matches(schedules, start, days):
+    # Bool matrix with a row per schedule and a column per day from start,
+    # True on the days the job fires at least once.
+    dates = [start + datetime.timedelta(days=n) for n in range(days)]
+    dom = np.array([d.day for d in dates], dtype=np.int64)
+    dow = np.array([d.isoweekday() % 7 for d in dates], dtype=np.int64)
+    month = np.array([d.month for d in dates], dtype=np.int64)
+
+    doms = _bits([s.doms for s in schedules], 32)[:, dom]
+    dows = _bits([s.dows for s in schedules], 7)[:, dow]
+    months = _bits([s.months for s in schedules], 13)[:, month]
+    day_or = np.array([s.day_or for s in schedules])[:, None]
+    fires = np.array([bool(s.day_minutes) and not s.never for s in schedules])[:, None]
+    return np.where(day_or, doms | dows, doms & dows) & months & fires
+
+
+def concurrency(matrix, durations=None):
+    # Jobs running in each minute. Without durations every job counts for
+    # just the minute it starts in; with them a start keeps its job busy for
+    # durations[row] minutes, so long jobs weigh more than quick ones.
+    if durations is None:
+        return matrix.sum(axis=0)
+
+    durations = np.clip(np.asarray(durations, dtype=np.int64), 1, MINUTES_PER_DAY)
+    load = np.zeros(matrix.shape[1], dtype=np.int64)
+    ends = np.arange(1, matrix.shape[1] + 1)
+    for duration in np.unique(durations):
+        starts = np.concatenate(([0], np.cumsum(matrix[durations == duration].sum(axis=0))))
+        load += starts[ends] - starts[np.maximum(ends - duration, 0)]
+    return load
+
+
+def peak_minutes(matrix, top=10, durations=None):
+    # The `top` busiest minutes as (minute, load, [row, ...]), busiest first.
+    load = concurrency(matrix, durations)
+    if not load.any():
+        return []
+    top = min(top, int(np.count_nonzero(load)))
+    busiest = np.argsort(-load, kind='stable')[:top]
+    return [(int(m), load[m].item(), np.flatnonzero(matrix[:, m]).tolist()) for m in busiest]
+
+
+def best_slot(schedules, schedule, hours, minutes, durations=None, duration=1, start=None, days=31):
+    # Picks the start time for a new job that keeps peak concurrency lowest
+    # against `schedules`. hours and minutes are the values already chosen
+    # for the new job, or None for the field(s) that should be picked.
+    # Returns (hour, minute) with None for a field that was not picked.
+    if start is None:
+        start = datetime.date.today()
+    load = concurrency(occupancy(schedules, start, days), durations)
+
+    # Highest load anywhere in the new job's run for each possible start.
+    duration = int(min(max(duration, 1), MINUTES_PER_DAY))
+    window = load.copy()
+    for shift in range(1, duration):
+        window[:-shift] = np.maximum(window[:-shift], load[shift:])
+
+    day_match = [schedule.day_matches(start + datetime.timedelta(days=n)) for n in range(days)]
+    window = window.reshape(days, MINUTES_PER_DAY)[np.array(day_match, dtype=bool)]
+    if not len(window):
+        window = np.zeros((1, MINUTES_PER_DAY), dtype=np.int64)
+    peak = window.max(axis=0).reshape(24, 60)
+    total = window.sum(axis=0).reshape(24, 60)
+
+    rows = list(range(24)) if hours is None else list(hours)
+    cols = list(range(60)) if minutes is None else list(minutes)
+    peak = peak[np.ix_(rows, cols)]
+    total = total[np.ix_(rows, cols)]
+
+    if hours is not None:
+        peak, total = peak.max(axis=0, keepdims=True), total.sum(axis=0, keepdims=True)
+    if minutes is not None:
+        peak, total = peak.max(axis=1, keepdims=True), total.sum(axis=1, keepdims=True)
+
+    # Lowest peak first, then least total load, then earliest.
+    best = np.lexsort((total.ravel(), peak.ravel()))[0]
+    row, col = divmod(int(best), peak.shape[1])
+    return (None if hours is not None else rows[row]), (None if minutes is not None else cols[col])
+
+
+def minute_to_datetime(start, minute):
+    return datetime.datetime.combine(start, datetime.time()) + datetime.timedelta(minutes=int(minute))
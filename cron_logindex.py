@@ -0,0 +1,123 @@
+import os
+import re
+import sqlite3
+
+import cron_runs
+
+DEFAULT_INDEX = cron_runs.STATE_DIR + '/logs.db'
+
+# <ksh>_<hostname>_<YYYYMMDD>.log as written by build_command().
+LOG_RE = re.compile(r'^(.+)_([^_]+)_(\d{8})\.log$')
+# Lines cron_runner writes around each run.
+MARKER_RE = re.compile(rb'^#cron_runner (start|end) (\d+(?:\.\d+)?)', re.M)
+# How much of each end of a log to read looking for markers.
+MARKER_BYTES = 4096
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS logs (
+    name TEXT PRIMARY KEY,
+    ksh TEXT NOT NULL,
+    host TEXT NOT NULL,
+    day TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    start REAL,
+    end REAL
+);
+CREATE INDEX IF NOT EXISTS logs_ksh_day ON logs (ksh, day);
+'''
+
+
+def connect(path=DEFAULT_INDEX):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(path, timeout=30)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.executescript(SCHEMA)
+    return db
+
+
+def read_markers(path, size):
+    # (first start, last end) of the day's runs from cron_runner markers,
+    # None for either one that is not there.
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(MARKER_BYTES)
+            tail = head
+            if size > MARKER_BYTES:
+                f.seek(max(size - MARKER_BYTES, MARKER_BYTES))
+                tail = f.read()
+    except OSError:
+        return None, None
+
+    starts = [float(t) for kind, t in MARKER_RE.findall(head) if kind == b'start']
+    ends = [float(t) for kind, t in MARKER_RE.findall(tail) if kind == b'end']
+    return (starts[0] if starts else None), (ends[-1] if ends else None)
+
+
+def update(db, log_dir):
+    # Brings the index up to date with log_dir. Only files that are new, or
+    # from the newest two days (which may still be written to), are stat'ed
+    # and read. Returns (new files, refreshed files, files in index).
+    known = set(name for (name,) in db.execute('SELECT name FROM logs'))
+    recent = set(name for (name,) in db.execute(
+        'SELECT name FROM logs WHERE day >= (SELECT MIN(day) FROM (SELECT DISTINCT day FROM logs ORDER BY day DESC LIMIT 2))'))
+
+    rows = []
+    new = refreshed = 0
+    with os.scandir(log_dir) as entries:
+        for entry in entries:
+            name = entry.name
+            if name in known and name not in recent:
+                continue
+            match = LOG_RE.match(name)
+            if not match:
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if name in known:
+                refreshed += 1
+            else:
+                new += 1
+            # Without an end marker the last write is the best guess.
+            start, end = read_markers(entry.path, stat.st_size)
+            rows.append((name, match.group(1), match.group(2), match.group(3), stat.st_size, stat.st_mtime,
+                         start, end if end is not None else stat.st_mtime))
+
+    with db:
+        db.executemany('INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    total = db.execute('SELECT COUNT(*) FROM logs').fetchone()[0]
+    return new, refreshed, total
+
+
+def logged_days(db, host=None, first='', last='99999999'):
+    # {ksh: set of YYYYMMDD} for every log from first to last, in one pass.
+    sql = 'SELECT ksh, day FROM logs WHERE day >= ? AND day <= ?'
+    params = [first, last]
+    if host:
+        sql += ' AND (host = ? OR host LIKE ?)'
+        params += [host, host + '.%']
+    days = {}
+    for ksh, day in db.execute(sql, params):
+        days.setdefault(ksh, set()).add(day)
+    return days
+
+
+def history(db, ksh, host=None):
+    # [(day, host, size, start, end)] for ksh, oldest first.
+    sql = 'SELECT day, host, size, start, end FROM logs WHERE ksh = ?'
+    params = [ksh]
+    if host:
+        sql += ' AND host = ?'
+        params.append(host)
+    return db.execute(sql + ' ORDER BY day, host', params).fetchall()
+
+
+def summary(db):
+    # [(ksh, days logged, first day, last day, total bytes)] per ksh.
+    return db.execute(
+        'SELECT ksh, COUNT(*), MIN(day), MAX(day), SUM(size) FROM logs GROUP BY ksh ORDER BY ksh'
+    ).fetchall()
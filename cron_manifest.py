@@ -0,0 +1,113 @@
+import csv
+import json
+import os
+
+from crontab import CronSlices
+
+from cron_jobs import build_command, clean_directory_name, clean_ksh_name, make_title
+from cron_runs import OVERLAP_POLICIES
+
+FIELDS = ('title', 'directory', 'ksh', 'schedule')
+# Optional: "overlap" is skip, queue or kill to run the job single-instance.
+
+
+class ManifestError(Exception):
+    pass
+
+
+def load_manifest(path):
+    ext = os.path.splitext(path)[1].lower()
+    with open(path) as f:
+        if ext in ('.yml', '.yaml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ManifestError('PyYAML is needed to read ' + path + ', use a .json or .csv manifest instead.')
+            rows = yaml.safe_load(f)
+        elif ext == '.json':
+            rows = json.load(f)
+        elif ext == '.csv':
+            rows = list(csv.DictReader(f))
+        else:
+            raise ManifestError('Unknown manifest type "' + ext + '", expected .yaml, .yml, .json or .csv')
+
+    # Allow either a bare list or {"jobs": [...]}.
+    if isinstance(rows, dict):
+        rows = rows.get('jobs')
+    if not isinstance(rows, list):
+        raise ManifestError(path + ' does not contain a list of jobs.')
+    return rows
+
+
+def validate_rows(rows, existing_titles=()):
+    # Returns (valid, errors). valid is a list of (row_number, spec) and
+    # errors a list of (row_number, message); row numbers start at 1.
+    valid = []
+    errors = []
+    seen = set(existing_titles)
+    # Manifests tend to reuse a handful of schedules, only parse each once.
+    checked = {}
+
+    for number, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            errors.append((number, 'row is not a mapping'))
+            continue
+
+        missing = [field for field in FIELDS if not str(row.get(field) or '').strip()]
+        if missing:
+            errors.append((number, 'missing ' + ', '.join(missing)))
+            continue
+
+        try:
+            directory_name = clean_directory_name(str(row['directory']))
+            ksh_name = clean_ksh_name(str(row['ksh']))
+        except ValueError as e:
+            errors.append((number, str(e)))
+            continue
+
+        schedule = ' '.join(str(row['schedule']).split())
+        if schedule not in checked:
+            checked[schedule] = CronSlices.is_valid(schedule)
+        if not checked[schedule]:
+            errors.append((number, 'invalid schedule "' + schedule + '"'))
+            continue
+
+        overlap = str(row.get('overlap') or '').strip().lower() or None
+        if overlap and overlap not in OVERLAP_POLICIES:
+            errors.append((number, 'overlap must be one of ' + ', '.join(OVERLAP_POLICIES)))
+            continue
+
+        title = make_title(str(row['title']).strip())
+        if title in seen:
+            errors.append((number, 'a job titled "#' + title + '" already exists'))
+            continue
+        seen.add(title)
+
+        valid.append((number, {
+            'title': title,
+            'directory': directory_name,
+            'ksh': ksh_name,
+            'schedule': schedule,
+            'overlap': overlap,
+        }))
+
+    return valid, errors
+
+
+def apply_rows(cron, valid, rbmuser, billopsuser, record_runs=False):
+    # Adds every validated row to the already loaded crontab. The caller does
+    # the single cron.write() afterwards. Returns per-row errors.
+    errors = []
+    for number, spec in valid:
+        job = cron.new(
+            command=build_command(billopsuser, spec['directory'], spec['ksh'], record_runs, spec['overlap']),
+            user=str(rbmuser),
+            comment=spec['title'],
+            pre_comment=True,
+        )
+        try:
+            job.setall(spec['schedule'])
+        except (KeyError, ValueError) as e:
+            cron.remove(job)
+            errors.append((number, str(e)))
+    return errors
@@ -0,0 +1,46 @@
+import collections
+import datetime
+
+import numpy as np
+
+import cron_load
+import cron_logindex
+from cron_jobs import ksh_from_command
+
+# Jobs whose ksh expected to log on days it did not, and logged on days it
+# was not expected to.
+Report = collections.namedtuple('Report', 'ksh missed unexpected')
+
+
+def find_missed(entries, db, start, end, host=None):
+    # Compares every logging job in the parse_crontab() entries against the
+    # log index for the days start..end (dates, inclusive). Jobs sharing a
+    # ksh are merged. Days before a ksh's first log are ignored, the job may
+    # not have existed.
+    jobs = [(entry, schedule) for entry, schedule in cron_load.crontab_schedules(entries)
+            if '.log' in entry.command and '>' in entry.command]
+    days = (end - start).days + 1
+    if not jobs or days < 1:
+        return []
+
+    matches = cron_load.day_matches([schedule for entry, schedule in jobs], start, days)
+    names = np.array([(start + datetime.timedelta(days=n)).strftime('%Y%m%d') for n in range(days)])
+
+    expected = {}
+    for row, (entry, schedule) in enumerate(jobs):
+        ksh = ksh_from_command(entry.command)
+        expected.setdefault(ksh, set()).update(names[matches[row]].tolist())
+
+    reports = []
+    first, last = names[0], names[-1]
+    logs = cron_logindex.logged_days(db, host)
+    for ksh in sorted(expected):
+        logged = logs.get(ksh, set())
+        since = max(first, min(logged)) if logged else first
+        actual = set(day for day in logged if since <= day <= last)
+        wanted = set(day for day in expected[ksh] if day >= since)
+        missed = sorted(wanted - actual)
+        unexpected = sorted(actual - wanted)
+        if missed or unexpected:
+            reports.append(Report(ksh, missed, unexpected))
+    return reports
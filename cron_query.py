@@ -0,0 +1,61 @@
+import fnmatch
+import os
+
+from cron_jobs import script_from_command
+
+
+def directory_of(script):
+    # The $BIN/<directory> a script is in, from build_command()'s layout.
+    if '/bin/' in script:
+        return os.path.dirname(script.split('/bin/', 1)[1])
+    return os.path.basename(os.path.dirname(script))
+
+
+class JobIndex(object):
+    # Crontab entries keyed by title, $BIN directory, script path and name,
+    # and schedule. Filters look values up in these rather than checking
+    # every entry, and only patterns with wildcards scan the keys.
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self.fields = dict((field, {}) for field in ('title', 'directory', 'script', 'name', 'schedule'))
+        for n, entry in enumerate(self.entries):
+            script = script_from_command(entry.command)
+            values = (
+                ('title', entry.title),
+                ('directory', directory_of(script)),
+                ('script', script),
+                ('name', os.path.basename(script)),
+                ('schedule', entry.schedule),
+            )
+            for field, value in values:
+                self.fields[field].setdefault(value, []).append(n)
+
+    def lookup(self, field, pattern):
+        # Positions of the entries whose field matches pattern, a shell
+        # style wildcard pattern or an exact value.
+        index = self.fields[field]
+        if not any(c in pattern for c in '*?['):
+            return set(index.get(pattern, ()))
+        rows = set()
+        for value in fnmatch.filter(index, pattern):
+            rows.update(index[value])
+        return rows
+
+    def select(self, title=None, directory=None, script=None, schedule=None):
+        # Entries matching every filter given, in crontab order. A script
+        # pattern without a "/" matches the script's file name.
+        filters = [('title', title), ('directory', directory), ('schedule', schedule)]
+        if script:
+            filters.append(('script' if '/' in script else 'name', script))
+        rows = None
+        for field, pattern in filters:
+            if not pattern:
+                continue
+            if field == 'schedule':
+                pattern = ' '.join(pattern.split())
+            hits = self.lookup(field, pattern)
+            rows = hits if rows is None else rows & hits
+        if rows is None:
+            return list(self.entries)
+        return [self.entries[n] for n in sorted(rows)]
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# Runs a cron job's script and records when it ran, its exit code and peak
+# memory in the cron_runs store. The script's output goes wherever the
+# runner's does, so the crontab's ">> log 2>&1" still writes the same log.
+#
+# With --single-instance the runner also stops a job from piling up when a
+# run outlasts its interval, see cron_runs.OVERLAP_POLICIES.
+import argparse
+import fcntl
+import os
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import cron_runs
+
+# Seconds a killed run gets to exit before it is sent SIGKILL.
+KILL_GRACE = 30
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run a cron job and record its runtime.')
+    parser.add_argument('--store', default=cron_runs.DEFAULT_STORE, help='SQLite file to record runs in')
+    parser.add_argument('--name', help='name to record the run under (default: script name without .ksh)')
+    parser.add_argument('--single-instance', choices=cron_runs.OVERLAP_POLICIES,
+                        help='when the last run is still going: skip this run, queue it, or kill the old run')
+    parser.add_argument('--lock-dir', default=cron_runs.LOCK_DIR, help='where --single-instance keeps its lock files')
+    parser.add_argument('script', help='script to run')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='arguments for the script')
+    return parser.parse_args(argv)
+
+
+def acquire(name, policy, lock_dir):
+    # Returns (lock file or None to not run, overlap action or None).
+    os.makedirs(lock_dir, exist_ok=True)
+    lock = open(os.path.join(lock_dir, name + '.lock'), 'a+')
+    if try_lock(lock):
+        return lock, None
+
+    if policy == 'skip':
+        lock.close()
+        return None, 'skipped'
+
+    if policy == 'queue':
+        # Only one run may wait, any more are skipped.
+        queue = open(os.path.join(lock_dir, name + '.queue'), 'a')
+        if not try_lock(queue):
+            queue.close()
+            lock.close()
+            return None, 'skipped'
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        queue.close()
+        return lock, 'queued'
+
+    # kill: the lock file holds "<runner pid> <job pid>" of the old run.
+    lock.seek(0)
+    pids = [int(pid) for pid in lock.read().split() if pid.isdigit()]
+    signal_pids(pids, signal.SIGTERM)
+    deadline = time.time() + KILL_GRACE
+    while not try_lock(lock):
+        if time.time() > deadline:
+            signal_pids(pids, signal.SIGKILL)
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            break
+        time.sleep(0.2)
+    return lock, 'killed'
+
+
+def try_lock(f):
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except (BlockingIOError, PermissionError):
+        return False
+
+
+def signal_pids(pids, signum):
+    for pid in pids:
+        try:
+            os.kill(pid, signum)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def run(script, args, lock=None):
+    process = subprocess.Popen([script] + args)
+    if lock is not None:
+        lock.seek(0)
+        lock.truncate()
+        lock.write(str(os.getpid()) + ' ' + str(process.pid) + '\n')
+        lock.flush()
+
+    # Pass a kill from cron or an operator on to the job.
+    def forward(signum, frame):
+        process.send_signal(signum)
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    signal.signal(signal.SIGHUP, forward)
+
+    return process.wait()
+
+
+def main():
+    args = parse_args()
+    name = args.name or os.path.basename(args.script)
+    if name.endswith('.ksh'):
+        name = name[:-4]
+
+    host = socket.gethostname().split('.')[0]
+
+    lock = None
+    if args.single_instance:
+        lock, action = acquire(name, args.single_instance, args.lock_dir)
+        if action:
+            save(args.store, cron_runs.record_overlap, name, host, time.time(), action)
+        if lock is None:
+            sys.stderr.write('cron_runner: ' + name + ' is still running, skipped this run\n')
+            sys.exit(0)
+
+    start = time.time()
+    marker('start', start)
+    try:
+        code = run(args.script, args.args, lock)
+    except OSError as e:
+        sys.stderr.write('cron_runner: could not run ' + args.script + ': ' + str(e) + '\n')
+        code = 127
+    end = time.time()
+    # A job killed by a signal exits like the shell reports it, in the log
+    # and the runs store alike.
+    if code < 0:
+        code = 128 - code
+    marker('end', end, ' exit ' + str(code))
+    max_rss_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    save(args.store, cron_runs.record_run, name, host, start, end, code, max_rss_kb)
+    sys.exit(code)
+
+
+def marker(kind, when, extra=''):
+    # Lets cron_logindex find run times in the log. Flushed so it stays in
+    # order with the script's own output.
+    stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(when))
+    sys.stdout.write('#cron_runner ' + kind + ' ' + '%.3f' % when + ' ' + stamp + extra + '\n')
+    sys.stdout.flush()
+
+
+def save(store, record, *values):
+    try:
+        db = cron_runs.connect(store)
+        record(db, *values)
+        db.close()
+    except Exception as e:
+        # Never fail the job because its stats could not be saved.
+        sys.stderr.write('cron_runner: could not record run in ' + store + ': ' + str(e) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import getpass
+import math
+import os
+import sqlite3
+import time
+
+# Kept on local disk: SQLite locking is not safe on the NFS home dirs.
+STATE_DIR = '/var/tmp/cron_automation/' + getpass.getuser()
+DEFAULT_STORE = STATE_DIR + '/runs.db'
+LOCK_DIR = STATE_DIR + '/locks'
+# Where every account working on a crontab finds its daemon and lock,
+# whoever it runs as. Sticky and world writable, like /tmp.
+SHARED_DIR = '/var/tmp/cron_automation/shared'
+
+# What cron_runner does when a job is started while its last run is still
+# going: skip the new run, let one run wait for the old one, or kill the
+# old one.
+OVERLAP_POLICIES = ('skip', 'queue', 'kill')
+
+def shared_dir():
+    # SHARED_DIR, created if need be. Its parent is opened up too, so every
+    # account can make its own STATE_DIR there. Only a directory's owner
+    # can chmod it, which the first account to get here is.
+    for path in (os.path.dirname(SHARED_DIR), SHARED_DIR):
+        os.makedirs(path, exist_ok=True)
+        if os.stat(path).st_mode & 0o7777 != 0o1777:
+            try:
+                os.chmod(path, 0o1777)
+            except OSError:
+                pass
+    return SHARED_DIR
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    ksh TEXT NOT NULL,
+    host TEXT NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    exit_code INTEGER NOT NULL,
+    max_rss_kb INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_ksh_start ON runs (ksh, start);
+CREATE TABLE IF NOT EXISTS overlaps (
+    ksh TEXT NOT NULL,
+    host TEXT NOT NULL,
+    time REAL NOT NULL,
+    action TEXT NOT NULL
+);
+'''
+
+
+def connect(path=DEFAULT_STORE):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(path, timeout=30)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.executescript(SCHEMA)
+    return db
+
+
+def record_run(db, ksh, host, start, end, exit_code, max_rss_kb):
+    with db:
+        db.execute('INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?)', (ksh, host, start, end, exit_code, max_rss_kb))
+
+
+def record_overlap(db, ksh, host, when, action):
+    # action is "skipped", "queued" or "killed".
+    with db:
+        db.execute('INSERT INTO overlaps VALUES (?, ?, ?, ?)', (ksh, host, when, action))
+
+
+def overlap_counts(path=DEFAULT_STORE, days=30):
+    # [(ksh, action, count)] over the last `days` days, most first.
+    if not os.path.exists(path):
+        return []
+    db = sqlite3.connect(path, timeout=30)
+    try:
+        return db.execute(
+            'SELECT ksh, action, COUNT(*) FROM overlaps WHERE time >= ? GROUP BY ksh, action ORDER BY 3 DESC, 1',
+            (time.time() - days * 86400,),
+        ).fetchall()
+    except sqlite3.Error:
+        return []
+    finally:
+        db.close()
+
+
+def runtimes(path=DEFAULT_STORE, days=30):
+    # {ksh: average runtime in whole minutes} over the last `days` days, or
+    # {} when nothing has been recorded yet.
+    if not os.path.exists(path):
+        return {}
+    db = sqlite3.connect(path, timeout=30)
+    try:
+        rows = db.execute(
+            'SELECT ksh, AVG(end - start) FROM runs WHERE start >= ? GROUP BY ksh',
+            (time.time() - days * 86400,),
+        ).fetchall()
+    except sqlite3.Error:
+        return {}
+    finally:
+        db.close()
+    return dict((ksh, max(1, int(math.ceil(seconds / 60.0)))) for ksh, seconds in rows)
@@ -0,0 +1,186 @@
+import datetime
+from functools import lru_cache
+
+# (low, high) for minute, hour, day of month, month and day of week.
+FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+MONTH_NAMES = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+DOW_NAMES = ['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat']
+
+SPECIALS = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+
+# Give up looking for the next run after this many days, e.g. for "0 0 30 2 *".
+SEARCH_DAYS = 8 * 366
+
+
+def _value(text, field):
+    text = text.lower()
+    if field == 3 and text[:3] in MONTH_NAMES:
+        return MONTH_NAMES.index(text[:3]) + 1
+    if field == 4 and text[:3] in DOW_NAMES:
+        return DOW_NAMES.index(text[:3])
+    return int(text)
+
+
+def parse_field(text, field):
+    # Returns the field as a bitset where bit n is set when value n matches.
+    low, high = FIELD_RANGES[field]
+    bits = 0
+    for part in text.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/', 1)
+            step = int(step)
+            if step < 1:
+                raise ValueError('step must be at least 1 in "' + text + '"')
+
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = part.split('-', 1)
+            start, end = _value(start, field), _value(end, field)
+        else:
+            start = _value(part, field)
+            # "5/15" means every 15 starting at 5.
+            end = high if step > 1 else start
+
+        if start < low or end > high or start > end:
+            raise ValueError('"' + part + '" is out of range ' + str(low) + '-' + str(high))
+
+        for n in range(start, end + 1, step):
+            bits |= 1 << n
+
+    # Day of week 7 is another name for Sunday.
+    if field == 4 and bits & (1 << 7):
+        bits = (bits | 1) & ~(1 << 7)
+    return bits
+
+
+def _bit_list(bits):
+    return [n for n in range(bits.bit_length()) if bits >> n & 1]
+
+
+class Schedule(object):
+
+    def __init__(self, expression):
+        expression = ' '.join(str(expression).split())
+        self.expression = expression
+        self.never = expression == '@reboot'
+        if self.never:
+            expression = '0 0 1 1 *'
+        expression = SPECIALS.get(expression.lower(), expression)
+
+        fields = expression.split(' ')
+        if len(fields) != 5:
+            raise ValueError('"' + self.expression + '" does not have 5 fields')
+
+        self.minutes, self.hours, self.doms, self.months, self.dows = [
+            parse_field(text, n) for n, text in enumerate(fields)
+        ]
+        # Vixie cron: when both day fields are restricted a day matches if
+        # EITHER of them does, otherwise both have to match.
+        self.dom_star = fields[2].startswith('*')
+        self.dow_star = fields[4].startswith('*')
+        self.day_or = not self.dom_star and not self.dow_star
+
+        self.minute_list = _bit_list(self.minutes)
+        self.hour_list = _bit_list(self.hours)
+        # Minute of the day of every fire on a matching day.
+        self.day_minutes = [h * 60 + m for h in self.hour_list for m in self.minute_list]
+        self.day_deltas = [datetime.timedelta(minutes=m) for m in self.day_minutes]
+
+    def __repr__(self):
+        return 'Schedule(' + repr(self.expression) + ')'
+
+    def day_matches(self, day):
+        if self.never or not self.months >> day.month & 1:
+            return False
+        dom = self.doms >> day.day & 1
+        dow = self.dows >> (day.isoweekday() % 7) & 1
+        if self.day_or:
+            return bool(dom or dow)
+        return bool(dom and dow)
+
+    def days_between(self, start, end):
+        # Every date in [start, end] the job fires on at least once.
+        days = []
+        day = start
+        one_day = datetime.timedelta(days=1)
+        while day <= end:
+            if self.day_matches(day):
+                days.append(day)
+            day += one_day
+        return days
+
+    def minutes_between(self, start, end):
+        # Fire times in [start, end) as whole minutes since start. This is the
+        # cheap form to use when enumerating months or years of fires.
+        start = _floor_minute(start)
+        origin = datetime.datetime.combine(start.date(), datetime.time())
+        first = int((start - origin).total_seconds() // 60)
+        last = int((end - origin).total_seconds() // 60)
+        fires = []
+        if not self.day_minutes:
+            return fires
+        for day in self.days_between(start.date(), (end - datetime.timedelta(microseconds=1)).date()):
+            base = (day - origin.date()).days * 1440
+            if first <= base and base + 1440 <= last:
+                fires.extend([base + m - first for m in self.day_minutes])
+            else:
+                fires.extend([base + m - first for m in self.day_minutes if first <= base + m < last])
+        return fires
+
+    def runs_between(self, start, end):
+        start = _floor_minute(start)
+        runs = []
+        for day in self.days_between(start.date(), end.date()):
+            midnight = datetime.datetime.combine(day, datetime.time())
+            runs.extend([midnight + delta for delta in self.day_deltas])
+        # Only the first and last day can be partial.
+        first = 0
+        while first < len(runs) and runs[first] < start:
+            first += 1
+        while runs and runs[-1] >= end:
+            runs.pop()
+        return runs[first:]
+
+    def next_runs(self, count, after=None):
+        # The next count fire times strictly after `after` (default: now).
+        if after is None:
+            after = datetime.datetime.now()
+        after = _floor_minute(after)
+        runs = []
+        day = after.date()
+        one_day = datetime.timedelta(days=1)
+        for _ in range(SEARCH_DAYS):
+            if self.day_matches(day):
+                for minute in self.day_minutes:
+                    run = datetime.datetime.combine(day, datetime.time(minute // 60, minute % 60))
+                    if run > after:
+                        runs.append(run)
+                        if len(runs) == count:
+                            return runs
+            day += one_day
+        return runs
+
+
+def _floor_minute(when):
+    return when.replace(second=0, microsecond=0)
+
+
+@lru_cache(maxsize=4096)
+def compile_schedule(expression):
+    return Schedule(expression)
+
+
+def job_expression(job):
+    # Schedule part of a python-crontab CronItem, e.g. "0 5 * * 1".
+    return job.slices.render()
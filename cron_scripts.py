@@ -0,0 +1,179 @@
+import json
+import os
+
+from cron_jobs import bin_dir, is_dispatched, script_from_command
+from cron_runs import STATE_DIR
+
+SCRIPT_SUFFIX = '.ksh'
+
+
+def cache_path(billopsuser):
+    return os.path.join(STATE_DIR, 'scripts_' + billopsuser + '.json')
+
+
+def mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def scan_directory(path):
+    # {script: executable} for the .ksh files directly in path.
+    scripts = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.endswith(SCRIPT_SUFFIX) and entry.is_file():
+                scripts[entry.name] = os.access(entry.path, os.X_OK)
+    return scripts
+
+
+class ScriptIndex(object):
+    # The $BIN directories and the .ksh scripts in each, kept in a JSON file
+    # between runs. $BIN is NFS mounted and slow to list, so refresh() lists
+    # $BIN only when its mtime changed and each directory only when its own
+    # did. Only chmod doesn't change a directory's mtime, so a script made
+    # executable since it was listed is found by checking it again.
+
+    def __init__(self, billopsuser, root=None, path=None):
+        self.root = root or bin_dir(billopsuser)
+        self.path = path or cache_path(billopsuser)
+        self.mtime = None
+        self.dirs = {}
+        self.changed = False
+        try:
+            with open(self.path) as f:
+                cached = json.load(f)
+            if cached['root'] == self.root:
+                self.mtime = cached['mtime']
+                self.dirs = cached['dirs']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def save(self):
+        if not self.changed:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'root': self.root, 'mtime': self.mtime, 'dirs': self.dirs}, f)
+        os.replace(tmp, self.path)
+        self.changed = False
+
+    def clear(self):
+        # Forgets everything, so the next refresh() lists every directory.
+        self.mtime = None
+        self.dirs = {}
+        self.changed = True
+
+    def refresh(self):
+        # Returns the number of directories listed again.
+        root_mtime = mtime(self.root)
+        if root_mtime is None:
+            if self.dirs or self.mtime is not None:
+                self.mtime = None
+                self.dirs = {}
+                self.changed = True
+            return 0
+
+        if root_mtime != self.mtime:
+            names = set()
+            with os.scandir(self.root) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        names.add(entry.name)
+            for name in set(self.dirs) - names:
+                del self.dirs[name]
+            for name in names - set(self.dirs):
+                self.dirs[name] = {'mtime': None, 'scripts': {}}
+            self.mtime = root_mtime
+            self.changed = True
+
+        listed = 0
+        for name in sorted(self.dirs):
+            if self.refresh_directory(name):
+                listed += 1
+        return listed
+
+    def refresh_directory(self, name):
+        # Lists $BIN/name again if it changed. Returns True when it did.
+        directory = self.dirs.get(name)
+        if directory is None:
+            return False
+        path = os.path.join(self.root, name)
+        dir_mtime = mtime(path)
+        if dir_mtime is not None and dir_mtime == directory['mtime']:
+            return False
+        try:
+            directory['scripts'] = scan_directory(path) if dir_mtime is not None else {}
+        except OSError:
+            directory['scripts'] = {}
+        directory['mtime'] = dir_mtime
+        self.changed = True
+        return True
+
+    def directories(self):
+        return sorted(self.dirs)
+
+    def scripts(self, name):
+        return sorted(self.dirs.get(name, {}).get('scripts', {}))
+
+    def check(self, directory_name, ksh_name):
+        # None when $BIN/directory_name/ksh_name is an executable script,
+        # else what is wrong with it. ksh_name may be None to check only the
+        # directory.
+        directory = self.dirs.get(directory_name)
+        if directory is None:
+            return '$BIN/' + directory_name + ' does not exist'
+        if ksh_name is None:
+            return None
+        executable = directory['scripts'].get(ksh_name)
+        if executable is None:
+            return '$BIN/' + directory_name + '/' + ksh_name + ' does not exist'
+        if not executable:
+            # It may have been chmod'ed since it was indexed.
+            path = os.path.join(self.root, directory_name, ksh_name)
+            if os.access(path, os.X_OK):
+                directory['scripts'][ksh_name] = True
+                self.changed = True
+                return None
+            return '$BIN/' + directory_name + '/' + ksh_name + ' is not executable'
+        return None
+
+    def check_path(self, path):
+        # check() for a script path from a crontab line. Paths outside $BIN
+        # are not indexed and are checked directly.
+        prefix = self.root.rstrip('/') + '/'
+        if path.startswith(prefix) and path.count('/', len(prefix)) == 1:
+            directory_name, ksh_name = path[len(prefix):].split('/')
+            if ksh_name.endswith(SCRIPT_SUFFIX):
+                return self.check(directory_name, ksh_name)
+        if not os.path.isfile(path):
+            return path + ' does not exist'
+        if not os.access(path, os.X_OK):
+            return path + ' is not executable'
+        return None
+
+
+def broken_jobs(index, entries):
+    # [(entry, problem)] for the crontab entries cron or cron_dispatch.py
+    # still runs whose script is missing or not executable.
+    broken = []
+    for entry in entries:
+        if not entry.enabled and not is_dispatched(entry):
+            continue
+        script = script_from_command(entry.command)
+        if not script.startswith('/'):
+            continue
+        problem = index.check_path(script)
+        if problem:
+            broken.append((entry, problem))
+    return broken
+
+
+def completer(words):
+    # A readline completer offering the words starting with what was typed.
+    def complete(text, state):
+        matches = [word for word in words if word.startswith(text)]
+        return matches[state] if state < len(matches) else None
+    return complete
@@ -0,0 +1,202 @@
+import collections
+import datetime
+import heapq
+import re
+
+import numpy as np
+
+from cron_jobs import is_dispatched, is_dispatcher, ksh_from_command, script_from_command
+from cron_load import MINUTES_PER_DAY
+from cron_schedule import compile_schedule
+
+# Minutes a job runs for when cron_runs has no record of it.
+DEFAULT_RUNTIME = 1
+
+POLICY_RE = re.compile(r'--single-instance\s+(\w+)')
+WORKERS_RE = re.compile(r'--workers\s+(\d+)')
+
+# group is the schedule of the dispatcher that runs the job, or None when
+# cron starts it. policy is its --single-instance policy or None.
+SimJob = collections.namedtuple('SimJob', 'label schedule duration policy group')
+
+# levels holds the most jobs running at once in each minute of the period.
+# skipped counts runs single-instance dropped, queued those that waited for
+# their last run, and waited those that waited for a dispatcher worker.
+Result = collections.namedtuple('Result', 'levels runs skipped queued waited')
+
+
+def job_from_entry(entry, runtimes, default=DEFAULT_RUNTIME, group=None):
+    policy = POLICY_RE.search(entry.command)
+    return SimJob(
+        entry.title or script_from_command(entry.command),
+        entry.schedule,
+        runtimes.get(ksh_from_command(entry.command), default),
+        policy.group(1) if policy else None,
+        group,
+    )
+
+
+def crontab_jobs(entries, runtimes, default=DEFAULT_RUNTIME):
+    # (jobs, {dispatcher schedule: workers}) for the crontab's entries.
+    # Dispatcher entries are not jobs themselves, the jobs they run are.
+    workers = {}
+    for entry in entries:
+        if is_dispatcher(entry):
+            match = WORKERS_RE.search(entry.command)
+            workers[entry.schedule] = int(match.group(1)) if match else 1
+
+    jobs = []
+    for entry in entries:
+        if is_dispatcher(entry):
+            continue
+        if is_dispatched(entry):
+            if entry.schedule in workers:
+                jobs.append(job_from_entry(entry, runtimes, default, entry.schedule))
+        elif entry.enabled:
+            jobs.append(job_from_entry(entry, runtimes, default))
+    return jobs, workers
+
+
+def simulate(jobs, workers, start, days):
+    # Runs every job from midnight of start for days days. Jobs cron just
+    # starts overlap freely and are worked out with numpy. Single-instance
+    # and dispatched jobs depend on what is still running, so their runs
+    # are stepped through in time order, with run ends waiting in a heap.
+    origin = datetime.datetime.combine(start, datetime.time())
+    end = origin + datetime.timedelta(days=days)
+
+    starts = []
+    stops = []
+    fires = []
+    counts = {'runs': 0, 'skipped': 0, 'queued': 0, 'waited': 0}
+    for n, job in enumerate(jobs):
+        try:
+            minutes = compile_schedule(job.schedule).minutes_between(origin, end)
+        except ValueError:
+            continue
+        if job.policy is None and job.group is None:
+            began = np.asarray(minutes, dtype=np.float64)
+            starts.append(began)
+            stops.append(began + job.duration)
+            counts['runs'] += len(minutes)
+        else:
+            fires.extend([(minute, n) for minute in minutes])
+    fires.sort()
+
+    began = []
+    ended = []
+    running = [0] * len(jobs)
+    waiting = [False] * len(jobs)
+    current = [None] * len(jobs)
+    killed = set()
+    active = dict((group, 0) for group in workers)
+    pending = dict((group, collections.deque()) for group in workers)
+    ends = []
+
+    def begin(n, t):
+        counts['runs'] += 1
+        current[n] = counts['runs']
+        running[n] += 1
+        began.append(t)
+        heapq.heappush(ends, (t + jobs[n].duration, current[n], n))
+
+    def stop(n, t):
+        running[n] -= 1
+        ended.append(t)
+        group = jobs[n].group
+        if group is not None:
+            active[group] -= 1
+            if pending[group]:
+                active[group] += 1
+                begin(pending[group].popleft(), t)
+        if waiting[n]:
+            waiting[n] = False
+            fire(n, t)
+
+    def fire(n, t):
+        job = jobs[n]
+        if running[n] and job.policy == 'skip':
+            counts['skipped'] += 1
+            return
+        if running[n] and job.policy == 'queue':
+            # One run may wait for the last, any more are skipped.
+            if waiting[n]:
+                counts['skipped'] += 1
+            else:
+                waiting[n] = True
+                counts['queued'] += 1
+            return
+        if running[n] and job.policy == 'kill':
+            killed.add(current[n])
+            stop(n, t)
+        if job.group is not None:
+            if active[job.group] >= workers[job.group]:
+                pending[job.group].append(n)
+                counts['waited'] += 1
+                return
+            active[job.group] += 1
+        begin(n, t)
+
+    def finish(until):
+        while ends and ends[0][0] <= until:
+            t, run, n = heapq.heappop(ends)
+            if run in killed:
+                killed.discard(run)
+            else:
+                stop(n, t)
+
+    for minute, n in fires:
+        finish(minute)
+        fire(n, minute)
+    finish(days * MINUTES_PER_DAY)
+
+    starts.append(np.asarray(began, dtype=np.float64))
+    stops.append(np.asarray(ended, dtype=np.float64))
+    return Result(minute_levels(np.concatenate(starts), np.concatenate(stops), days * MINUTES_PER_DAY),
+                  counts['runs'], counts['skipped'], counts['queued'], counts['waited'])
+
+
+def minute_levels(starts, stops, minutes):
+    # Most jobs running at once in each minute, given when runs started and
+    # stopped. A run stopping as another starts doesn't overlap it.
+    result = np.zeros(minutes, dtype=np.int64)
+    if not len(starts):
+        return result
+    times = np.concatenate((stops, starts))
+    deltas = np.concatenate((np.full(len(stops), -1, dtype=np.int64), np.ones(len(starts), dtype=np.int64)))
+    order = np.lexsort((deltas, times))
+    times = times[order]
+    levels = np.cumsum(deltas[order])
+
+    # Only the level once every change at the same time is made counts.
+    settled = np.append(times[1:] != times[:-1], True) & (times < minutes)
+    np.maximum.at(result, times[settled].astype(np.int64), levels[settled])
+    # Plus whatever was already running when each minute began.
+    last = np.searchsorted(times, np.arange(minutes), side='right') - 1
+    carried = np.where(last >= 0, levels[np.maximum(last, 0)], 0)
+    return np.maximum(result, carried)
+
+
+def worse_windows(before, after, top=5):
+    # [(first minute, end minute, most before, most after)] for the stretches
+    # where after runs more jobs at once than before, worst first.
+    worse = np.concatenate(([False], after > before, [False]))
+    edges = np.flatnonzero(worse[1:] != worse[:-1])
+    windows = []
+    for first, end in zip(edges[::2], edges[1::2]):
+        windows.append((int(first), int(end), int(before[first:end].max()), int(after[first:end].max())))
+    windows.sort(key=lambda w: (-w[3], w[0]))
+    return windows[:top]
+
+
+def timeline(levels, bucket):
+    # [(first minute, most jobs at once)] per bucket minutes.
+    rows = len(levels) // bucket
+    return [(n * bucket, int(peak)) for n, peak in enumerate(levels[:rows * bucket].reshape(rows, bucket).max(axis=1))]
+
+
+def compare(entries, added, runtimes, start, days, default=DEFAULT_RUNTIME):
+    # (before, after) Results for the crontab's entries without and with the
+    # SimJobs in added.
+    jobs, workers = crontab_jobs(entries, runtimes, default)
+    return simulate(jobs, workers, start, days), simulate(jobs + list(added), workers, start, days)
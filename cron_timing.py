@@ -0,0 +1,122 @@
+import contextlib
+import json
+import os
+import socket
+import threading
+import time
+
+from cron_runs import STATE_DIR
+
+# One JSON line per run is appended here.
+DEFAULT_LOG = os.environ.get('CRON_AUTOMATION_TIMINGS', STATE_DIR + '/timings.jsonl')
+# A node_exporter textfile collector file to rewrite after each run, if set.
+DEFAULT_TEXTFILE = os.environ.get('CRON_AUTOMATION_TEXTFILE')
+METRIC = 'cron_automation_phase_seconds'
+
+# [[phase, seconds]] in the order the phases started. Nested phases are
+# named "outer.inner" and count towards the outer phase too. Only phases of
+# the main thread are kept, and only once start() is called, so the daemon
+# and other long running users of these modules don't pile them up.
+recording = False
+phases = []
+_open = []
+# automate_cron.py imports this module near the top.
+_started = time.time()
+
+
+def start():
+    # The run's total still counts from when this module was imported, so
+    # it includes startup.
+    global recording
+    recording = True
+
+
+@contextlib.contextmanager
+def phase(name):
+    if not recording or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    _open.append(name)
+    full_name = '.'.join(_open)
+    timing = [full_name, 0.0]
+    phases.append(timing)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing[1] = time.perf_counter() - start
+        _open.pop()
+
+
+def totals():
+    # {phase: seconds}, adding up phases that ran more than once.
+    result = {}
+    for name, seconds in phases:
+        result[name] = result.get(name, 0.0) + seconds
+    return result
+
+
+def record(command, status, path=DEFAULT_LOG):
+    # Appends this run's timings as one JSON line.
+    line = json.dumps({
+        'time': round(_started, 3),
+        'host': socket.gethostname().split('.')[0],
+        'pid': os.getpid(),
+        'command': command,
+        'status': status,
+        'total': round(time.time() - _started, 6),
+        'phases': [[name, round(seconds, 6)] for name, seconds in phases],
+    })
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # One write of a line this short to a file opened for append isn't
+    # interleaved with other runs'.
+    with open(path, 'a') as f:
+        f.write(line + '\n')
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_textfile(path, command, status):
+    # Rewrites path in the Prometheus text format with this run's phases.
+    # node_exporter may read it at any time, so it is swapped in whole.
+    lines = [
+        '# HELP ' + METRIC + ' Seconds spent in each phase of the last automate_cron.py run.',
+        '# TYPE ' + METRIC + ' gauge',
+    ]
+    for name, seconds in sorted(totals().items()):
+        lines.append(METRIC + '{command="' + escape_label(command) + '",phase="' + escape_label(name) + '"} '
+                     + repr(round(seconds, 6)))
+    lines.extend([
+        '# HELP cron_automation_run_seconds Seconds the last automate_cron.py run took.',
+        '# TYPE cron_automation_run_seconds gauge',
+        'cron_automation_run_seconds{command="' + escape_label(command) + '",status="' + escape_label(status) + '"} '
+        + repr(round(time.time() - _started, 6)),
+        '# HELP cron_automation_last_run_timestamp_seconds When the last automate_cron.py run started.',
+        '# TYPE cron_automation_last_run_timestamp_seconds gauge',
+        'cron_automation_last_run_timestamp_seconds ' + repr(round(_started, 3)),
+    ])
+    tmp = path + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp, path)
+
+
+def report():
+    # Lines showing each phase's share of the run, for --timings. Phases
+    # that ran more than once are added up.
+    total = time.time() - _started
+    seconds = totals()
+    counts = {}
+    for name, _ in phases:
+        counts[name] = counts.get(name, 0) + 1
+    lines = ['Timings (' + '%.3f' % total + 's in all):']
+    for name in sorted(seconds, key=[name for name, _ in phases].index):
+        line = '    ' + ('  ' * name.count('.') + name.split('.')[-1]).ljust(24) + '%8.3f' % seconds[name] + 's'
+        if counts[name] > 1:
+            line += '  (' + str(counts[name]) + ' times)'
+        lines.append(line)
+    return lines
@@ -0,0 +1,357 @@
+import collections
+
+from cron_jobs import clean_directory_name, clean_ksh_name, make_title
+from cron_schedule import FIELD_RANGES, compile_schedule
+
+RESTART = 'restart'
+
+# Fields in the order a schedule is written, and the order the walk-through
+# asks about them.
+FIELD_ORDER = ('minute', 'hour', 'dom', 'month', 'dow')
+WALK_FIELDS = ('minute', 'hour', 'dow', 'dom', 'month')
+
+# What is asked at each step of a field: every -> one -> at, or
+# every -> one -> kind -> interval or list.
+PROMPTS = {
+    'minute': {
+        'every': 'Will this job run every minute? y|n',
+        'one': 'When called, will this job run at only one minute of the hour? y|n',
+        'at': "What minute of the hour will it run? 0-59 (or 'auto' to pick the least busy minute)",
+        'kind': 'Will it run on an [i]nterval (every __ days)? Or at [s]pecific minutes? i|s',
+        'interval': 'Every how many minutes do you want this to run? 0-59',
+        'list': 'What minutes do you want it to run at? (comma delimited, no spaces) 1-60',
+    },
+    'hour': {
+        'every': 'Will this job run every hour of the day? y|n',
+        'one': 'Will this job run at only one hour of the day? y|n',
+        'at': 'What hour of the day will this job run? 0-23',
+        'kind': 'Will this job run in an hourly [i]nterval (every __ hours) or at [s]pecified hours of the day? i|s',
+        'interval': 'Every how many hours do you want this to run? 0-23',
+        'list': 'What specific hours of the day do you want this to run? (comma delimited, no spaces) 0-23',
+    },
+    'dow': {
+        'every': 'Will this job run every day of the week? y|n',
+        'one': 'Does this job run only one day of the week? y|n',
+        'at': 'What day of the week will it run? (0=Sun, 1=Mon, etc...) 0-6',
+        'kind': 'Will this job run on an [i]nterval (every <n-th> day per week) or on [s]pecific days of the week? i|s',
+        'interval': 'Every which day each week do you want this to run (every nth day)? 0-6',
+        'list': 'What days of the week will it run? (comma delimited, no spaces) 0-6',
+    },
+    'dom': {
+        'every': 'Will this job run every day of the month? y|n',
+        'one': 'Will this job run only once a month? y|n',
+        'at': 'What day of the month will it run on? 1-31',
+        'kind': 'Will this job run on an [i]nterval (every __ days per month) or on [s]pecified days each month? i|s',
+        'interval': 'Every how many days per month will this to run? 0-31',
+        'list': 'What specific days of the month will this job run? (comma delimited, no spaces) 0-31',
+    },
+    'month': {
+        'every': 'Will this job run every month of the year? y|n',
+        'one': 'Will this job run only one month of the year? y|n',
+        'at': 'What month will this run? 1-12',
+        'kind': 'Will this job run on an [i]nterval (every __ months per year) or on [s]pecific months? i|s',
+        'interval': 'Every how many months will this run? 1-12',
+        'list': 'What specific months will this job run? (comma delimited, no spaces) 1-12',
+    },
+}
+
+OVERLAP_CHOICES = {'s': 'skip', 'q': 'queue', 'k': 'kill', 'n': None, '': None}
+
+# One job's answers. schedule has minute (and hour) 0 where auto_minute
+# (and auto_hour) ask for the least busy time to be picked. answers are
+# the answers that led here, to record and replay.
+JobAnswers = collections.namedtuple('JobAnswers', 'title directory ksh schedule auto_minute auto_hour overlap answers')
+
+
+class WalkthroughError(Exception):
+    pass
+
+
+class AnswerSource(object):
+    # Answers typed at the prompt, or replayed one per line from a file.
+
+    def __init__(self, replay=None):
+        self.replay = replay
+        self.lineno = 0
+
+    @property
+    def replaying(self):
+        return self.replay is not None
+
+    def next(self):
+        # The next answer, or None when the replay has run out.
+        if self.replay is None:
+            return input()
+        line = self.replay.readline()
+        if not line:
+            return None
+        self.lineno += 1
+        return line.rstrip('\r\n')
+
+    def where(self):
+        return getattr(self.replay, 'name', 'answers') + ' line ' + str(self.lineno)
+
+
+class Walkthrough(object):
+    # Asks for one job at a time as a state machine: each state prints its
+    # prompt, takes one answer and names the next state. A bad answer asks
+    # the same question again, or stops a replay, and "restart" goes back to
+    # the first schedule question, so nothing recurses however long it runs.
+
+    def __init__(self, source, output, titles=(), scripts=None, complete=None):
+        self.source = source
+        self.output = output
+        self.titles = set(titles)
+        self.scripts = scripts
+        self.complete = complete
+
+    def say(self, text=''):
+        # Prompts and echoes are left out of replays.
+        if not self.source.replaying:
+            self.output(text)
+
+    def run(self):
+        # JobAnswers for the next job, or None when a replay has no more.
+        self.given = []
+        self.job = {'auto_minute': False, 'auto_hour': False, 'overlap': None}
+        state = 'title'
+        while state is not None:
+            self.prompt(state)
+            answer = self.source.next()
+            if answer is None:
+                if state == 'title' and not self.given:
+                    return None
+                raise WalkthroughError(self.source.where() + ': the answers end in the middle of a job')
+            self.given.append(answer)
+            try:
+                state = self.handle(state, answer)
+            except ValueError as e:
+                self.given.pop()
+                if self.source.replaying:
+                    raise WalkthroughError(self.source.where() + ': ' + str(e))
+                self.output(str(e))
+
+        job = self.job
+        self.titles.add(make_title(job['title']))
+        return JobAnswers(job['title'], job['directory'], job['ksh'], self.schedule(), job['auto_minute'],
+                          job['auto_hour'], job['overlap'], self.given)
+
+    def prompt(self, state):
+        if state == 'title':
+            self.say('Enter the title you would like to be at the top of your cron job i.e. #===== <title>:')
+        elif state == 'directory':
+            self.say('Please enter the $BIN directory that your script exists in (no slashes or path, just the name):')
+            if self.scripts and self.complete and not self.source.replaying:
+                self.complete(self.scripts.directories())
+        elif state == 'ksh':
+            self.say('Enter name of your .ksh file:')
+            if self.scripts and self.complete and not self.source.replaying:
+                self.complete(self.scripts.scripts(self.job['directory']))
+        elif state in ('confirm_directory', 'confirm_ksh'):
+            self.say(self.problem + '. Use it anyway? y|n')
+        elif state == 'mode':
+            self.say("Do you want to enter the cron schedule using cron's syntax?")
+            self.say('Or do you want to be walked through it? (cron or walk-through) c|w')
+        elif state == 'cron':
+            self.say('Enter the schedule in the form (without brackets) <* * * * *>')
+        elif state == 'overlap':
+            self.say('This job runs on an interval. If a run is still going when the next one is due, should the new run')
+            self.say('[s]kip, [q]ueue behind it, [k]ill the old run, or [n]othing (let them overlap)? s|q|k|n')
+        else:
+            field, step = state.split('.')
+            for line in self.field_prompt(field, step):
+                self.say(line)
+
+    def field_prompt(self, field, step):
+        lines = [PROMPTS[field][step]]
+        day_of_week = self.job.get('dow', '*') != '*'
+        week_interval = self.job.get('dow', '').startswith('*/')
+        if field == 'hour' and step == 'at' and self.job['auto_minute']:
+            lines = ["What hour of the day will this job run? 0-23 (or 'auto' to pick the least busy hour)"]
+        elif field == 'dom' and step == 'every' and day_of_week:
+            lines = ['Since you have specified a per-week schedule, do you want this to ONLY run on a per-week schedule?',
+                     '(as opposed to a per-week AND per-month schedule) y|n']
+            if week_interval:
+                lines += ['Keep in mind that since you have specified an interval of the week for the job to run,',
+                          'choosing a per-month period to run will make the job called only when the schedule',
+                          'matches BOTH your weekly interval AND your monthly scheduled time. For example: Running',
+                          'every Friday if it is ALSO every 5th day of the month.']
+        elif field == 'dom' and step == 'at' and day_of_week:
+            if week_interval:
+                lines += ['Since you have specified a week-interval for this to run, this will run on both',
+                          'the day/days of the week you chose IF it is AlSO the day of the month you choose now.']
+            else:
+                lines += ['Since you have specified day/days of the week for this to run, this will run on both',
+                          'the day/days of the week you chose AND the day of the month you choose now.']
+        elif field == 'dom' and step == 'interval' and day_of_week:
+            lines += ['Since you have specified day/days of the week for this to run, this will run on',
+                      'the day/days of the week you chose IF it ALSO aligns with the interval that you',
+                      'specify now.']
+        elif field == 'dom' and step == 'list' and day_of_week:
+            lines += ['Since you have specified day/days of the week for this to run, this will run on',
+                      'both the day/days of the week you chose AND the days of the month you choose now.']
+        return lines
+
+    def handle(self, state, answer):
+        # The next state, None when the job is complete. Raises ValueError
+        # with what to tell the user when the answer can't be used.
+        if state == 'title':
+            if len(answer) == 0:
+                raise ValueError('Title cannot be empty.')
+            if make_title(answer) in self.titles:
+                raise ValueError('A job titled "#' + make_title(answer) + '" already exists.')
+            self.job['title'] = answer
+            self.say('#' + make_title(answer))
+            self.say()
+            return 'directory'
+
+        if state == 'directory':
+            self.job['directory'] = clean_directory_name(answer)
+            return self.check_script('confirm_directory', 'ksh')
+
+        if state == 'ksh':
+            self.job['ksh'] = clean_ksh_name(answer)
+            return self.check_script('confirm_ksh', 'mode')
+
+        if state in ('confirm_directory', 'confirm_ksh'):
+            # Not recorded: a replay elsewhere may not be asked.
+            self.given.pop()
+            if answer.lower() == 'y':
+                return self.accept_script(state == 'confirm_ksh')
+            self.given.pop()
+            return 'ksh' if state == 'confirm_ksh' else 'directory'
+
+        if state == 'mode':
+            choice = answer.lower()
+            if choice == 'c':
+                return 'cron'
+            if choice == 'w':
+                self.say("Enter 'restart' at any point to restart the walk-through.")
+                self.schedule_mark = len(self.given)
+                return self.start_schedule()
+            raise ValueError('Your options are [c] or [w].')
+
+        if state == 'cron':
+            if answer == RESTART:
+                del self.given[-2:]
+                return 'mode'
+            from crontab import CronSlices
+
+            schedule = ' '.join(answer.split())
+            try:
+                compile_schedule(schedule)
+            except ValueError as e:
+                raise ValueError('Invalid schedule: ' + str(e))
+            if not CronSlices.is_valid(schedule):
+                raise ValueError('Invalid schedule "' + schedule + '".')
+            # Kept whole, "@daily" and the other shortcuts have no fields.
+            self.job['schedule'] = schedule
+            return self.after_schedule()
+
+        if state == 'overlap':
+            choice = answer.lower()
+            if choice not in OVERLAP_CHOICES:
+                raise ValueError('Your options are [s], [q], [k] or [n].')
+            self.job['overlap'] = OVERLAP_CHOICES[choice]
+            return None
+
+        field, step = state.split('.')
+        if answer == RESTART:
+            self.say('Starting over.')
+            del self.given[self.schedule_mark:]
+            return self.start_schedule()
+        return self.field_step(field, step, answer)
+
+    def check_script(self, confirm, after):
+        # Asks to confirm a directory or script missing from the $BIN index.
+        # Replays just warn, the script may be deployed later.
+        if not self.scripts:
+            return self.accept_script(confirm == 'confirm_ksh')
+        ksh = self.job['ksh'] if confirm == 'confirm_ksh' else None
+        self.problem = self.scripts.check(self.job['directory'], ksh)
+        # A missing directory was already let through.
+        if ksh and self.scripts.check(self.job['directory'], None) is not None:
+            self.problem = None
+        if self.problem is None:
+            return self.accept_script(confirm == 'confirm_ksh')
+        if self.source.replaying:
+            self.output('Warning: ' + self.problem + ' (' + self.source.where() + ').')
+            return self.accept_script(confirm == 'confirm_ksh')
+        return confirm
+
+    def accept_script(self, ksh):
+        if ksh:
+            self.say('ksh script is: ' + self.job['ksh'])
+            self.say()
+            return 'mode'
+        self.say('Directory is $BIN/' + self.job['directory'])
+        self.say()
+        return 'ksh'
+
+    def start_schedule(self):
+        self.job.pop('schedule', None)
+        for field in WALK_FIELDS:
+            self.job[field] = '*'
+        self.job['auto_minute'] = self.job['auto_hour'] = False
+        return 'minute.every'
+
+    def field_step(self, field, step, answer):
+        choice = answer.lower()
+        if step in ('every', 'one'):
+            if choice not in ('y', 'n'):
+                raise ValueError('Your options are [y], [n], or [restart].')
+            if step == 'every':
+                return self.next_field(field) if choice == 'y' else field + '.one'
+            return field + ('.at' if choice == 'y' else '.kind')
+
+        if step == 'kind':
+            if choice == 'i':
+                return field + '.interval'
+            if choice == 's':
+                return field + '.list'
+            raise ValueError('Your options are [i], [s], or [restart].')
+
+        if step == 'at' and choice == 'auto' and (field == 'minute' or field == 'hour' and self.job['auto_minute']):
+            # Picked once the rest of the schedule is known.
+            self.job['auto_' + field] = True
+            value = '0'
+        elif step == 'at':
+            value = number(answer, field)
+        elif step == 'interval':
+            value = '*/' + number(answer, field, step=True)
+        else:
+            value = ','.join(number(part, field) for part in answer.split(','))
+        self.job[field] = value
+        return self.next_field(field)
+
+    def next_field(self, field):
+        n = WALK_FIELDS.index(field) + 1
+        if n < len(WALK_FIELDS):
+            return WALK_FIELDS[n] + '.every'
+        return self.after_schedule()
+
+    def schedule(self):
+        # The schedule as typed in cron mode, else built from the fields.
+        if 'schedule' in self.job:
+            return self.job['schedule']
+        return ' '.join(self.job[f] for f in FIELD_ORDER)
+
+    def after_schedule(self):
+        if '/' in self.schedule():
+            return 'overlap'
+        return None
+
+
+def number(text, field, step=False):
+    # text as a whole number in the field's range (or 1 up to its size for
+    # a step), else ValueError saying what was expected.
+    low, high = FIELD_RANGES[FIELD_ORDER.index(field)]
+    if step:
+        low = 1
+    try:
+        value = int(text.strip())
+    except ValueError:
+        value = None
+    if value is None or not low <= value <= high:
+        raise ValueError('Expected a number from ' + str(low) + ' to ' + str(high) + ', or [restart].')
+    return str(value)
@@ -0,0 +1,129 @@
+import fcntl
+import os
+
+import pytest
+
+import cron_apply
+from cron_apply import ConflictError, anchors, bulk_edit, hunks, join_lines, merge
+from cron_dispatch import members
+from cron_jobs import parse_crontab
+
+BASE = [
+    '# ====== one',
+    '0 1 * * * /bin/one.ksh',
+    '# ====== two',
+    '0 2 * * * /bin/two.ksh',
+    '# ====== three',
+    '0 3 * * * /bin/three.ksh',
+]
+
+
+def replaced(lines, old, new):
+    return [new if line == old else line for line in lines]
+
+
+def test_anchors_match_lines_found_once_in_order():
+    old = ['a', 'x', 'b', 'x', 'c']
+    new = ['c', 'a', 'b', 'x']
+    # x is not unique in old, and only one of a/c can keep its order.
+    assert anchors(old, new) == [(0, 1), (2, 2)]
+
+
+def test_hunks_rebuild_new_from_old():
+    new = replaced(BASE, '0 2 * * * /bin/two.ksh', '30 2 * * * /bin/two.ksh')[:4]
+    new += ['# ====== four', '0 4 * * * /bin/four.ksh']
+    rebuilt = list(BASE)
+    for first, end, lines in reversed(hunks(BASE, new)):
+        rebuilt[first:end] = lines
+    assert rebuilt == new
+
+
+def test_hunks_of_equal_lists_are_empty():
+    assert hunks(BASE, list(BASE)) == []
+
+
+def test_merge_keeps_changes_to_different_jobs():
+    ours = replaced(BASE, '0 1 * * * /bin/one.ksh', '15 1 * * * /bin/one.ksh')
+    theirs = BASE[:2] + BASE[4:]
+    assert merge(BASE, ours, theirs) == ['# ====== one', '15 1 * * * /bin/one.ksh'] + BASE[4:]
+
+
+def test_merge_conflict_on_the_same_line():
+    ours = replaced(BASE, '0 2 * * * /bin/two.ksh', '15 2 * * * /bin/two.ksh')
+    theirs = replaced(BASE, '0 2 * * * /bin/two.ksh', '45 2 * * * /bin/two.ksh')
+    with pytest.raises(ConflictError) as raised:
+        merge(BASE, ours, theirs)
+    assert raised.value.conflicts == [(['0 2 * * * /bin/two.ksh'], ['15 2 * * * /bin/two.ksh'],
+                                       ['45 2 * * * /bin/two.ksh'])]
+
+
+def test_merge_conflict_when_they_remove_what_we_edit():
+    ours = replaced(BASE, '0 3 * * * /bin/three.ksh', '# 0 3 * * * /bin/three.ksh')
+    theirs = BASE[:4]
+    with pytest.raises(ConflictError):
+        merge(BASE, ours, theirs)
+
+
+def test_merge_keeps_both_inserts_at_the_end_theirs_first():
+    ours = BASE + ['# ====== ours', '0 5 * * * /bin/ours.ksh']
+    theirs = BASE + ['# ====== theirs', '0 6 * * * /bin/theirs.ksh']
+    assert merge(BASE, ours, theirs) == BASE + ['# ====== theirs', '0 6 * * * /bin/theirs.ksh',
+                                                '# ====== ours', '0 5 * * * /bin/ours.ksh']
+
+
+def test_merge_applies_an_identical_change_once():
+    ours = replaced(BASE, '0 2 * * * /bin/two.ksh', '# 0 2 * * * /bin/two.ksh')
+    assert merge(BASE, ours, list(ours)) == ours
+
+    added = BASE + ['# ====== four', '0 4 * * * /bin/four.ksh']
+    assert merge(BASE, added, list(added)) == added
+
+
+def test_merge_from_an_empty_crontab():
+    ours = ['# ====== one', '0 1 * * * /bin/one.ksh']
+    assert merge([], ours, []) == ours
+    assert merge([], [], ours) == ours
+
+
+DISPATCHED_BASE = [
+    '# ====== one',
+    '#dispatched: 0 5 * * * /bin/one.ksh',
+    '# ====== two',
+    '#dispatched: 0 5 * * * /bin/two.ksh',
+    '# ====== dispatch 0 5 * * *',
+    '0 5 * * * python3 cron_dispatch.py --schedule "0 5 * * *"',
+]
+
+
+def test_retime_gives_a_dispatched_job_back_to_cron():
+    entries = [e for e in parse_crontab(join_lines(DISPATCHED_BASE)) if e.title == 'two']
+    lines = bulk_edit(DISPATCHED_BASE, entries, 'retime', '45 6 * * *')
+    assert lines[3] == '45 6 * * * /bin/two.ksh'
+    assert [e.title for e in members(join_lines(lines), '0 5 * * *')] == ['one']
+
+
+def test_retime_to_the_same_schedule_keeps_a_job_dispatched():
+    entries = [e for e in parse_crontab(join_lines(DISPATCHED_BASE)) if e.title == 'two']
+    assert bulk_edit(DISPATCHED_BASE, entries, 'retime', '0  5 * * *') == DISPATCHED_BASE
+
+
+def test_disable_and_enable_of_a_dispatched_job():
+    entries = [e for e in parse_crontab(join_lines(DISPATCHED_BASE)) if e.title == 'one']
+    assert bulk_edit(DISPATCHED_BASE, entries, 'disable')[1] == '# 0 5 * * * /bin/one.ksh'
+    assert bulk_edit(DISPATCHED_BASE, entries, 'enable')[1] == '0 5 * * * /bin/one.ksh'
+
+
+def test_locked_is_per_crontab_user_and_exclusive(tmp_path, monkeypatch):
+    monkeypatch.setattr(cron_apply, 'LOCK_DIR', str(tmp_path))
+    with cron_apply.locked('rbm'):
+        path = cron_apply.lock_path('rbm')
+        assert path == str(tmp_path / 'crontab.rbm.lock')
+        assert os.stat(path).st_mode & 0o777 == 0o666
+        other = open(path)
+        with pytest.raises(BlockingIOError):
+            fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # Another user's crontab has its own lock.
+        with cron_apply.locked('billops'):
+            pass
+    fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    other.close()
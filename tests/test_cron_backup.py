@@ -0,0 +1,90 @@
+import datetime
+import os
+
+from cron_backup import KEEP_ALL_DAYS, KEEP_DAILY_DAYS, BackupStore, Snapshot, retained
+
+NOW = datetime.datetime(2026, 10, 18, 12, 0)
+
+
+def epoch(days_ago, hour=12, minute=0):
+    # Local noon (or hour:minute) days_ago days before NOW.
+    when = NOW.replace(hour=hour, minute=minute) - datetime.timedelta(days=days_ago)
+    return int(when.timestamp())
+
+
+def snapshots(*times):
+    return [Snapshot(t, 'digest%d' % n, 10) for n, t in enumerate(sorted(times))]
+
+
+def kept_times(*times):
+    return [s.time for s in retained(snapshots(*times), int(NOW.timestamp()))]
+
+
+def test_everything_within_keep_all_days_is_kept():
+    times = [epoch(days, hour) for days in range(KEEP_ALL_DAYS) for hour in (1, 9, 17)]
+    assert kept_times(*times) == sorted(times)
+
+
+def test_the_last_snapshot_of_each_day_until_keep_daily_days():
+    days = (KEEP_ALL_DAYS + 1, 30, KEEP_DAILY_DAYS - 1)
+    times = [epoch(day, hour) for day in days for hour in (1, 9, 17)]
+    assert kept_times(*times) == sorted(epoch(day, 17) for day in days)
+
+
+def test_the_last_snapshot_of_each_month_after_keep_daily_days():
+    # All of April and May, far enough back for monthly buckets.
+    times = [int(datetime.datetime(2026, month, day, 12).timestamp()) for month in (4, 5) for day in range(1, 29)]
+    assert kept_times(*times) == [int(datetime.datetime(2026, 4, 28, 12).timestamp()),
+                                  int(datetime.datetime(2026, 5, 28, 12).timestamp())]
+
+
+def test_buckets_together():
+    recent = [epoch(1, 9), epoch(1, 17)]
+    daily = [epoch(20, 9), epoch(20, 17)]
+    monthly = [int(datetime.datetime(2025, 12, day, 12).timestamp()) for day in (3, 17)]
+    assert kept_times(*(recent + daily + monthly)) == [monthly[1], daily[1]] + recent
+
+
+def test_an_unchanged_crontab_creates_no_snapshot(tmp_path):
+    store = BackupStore(str(tmp_path))
+    first, created = store.snapshot('0 5 * * * a.ksh\n', now=epoch(1))
+    assert created
+    again, created = store.snapshot('0 5 * * * a.ksh\n', now=epoch(0))
+    assert not created
+    assert again == first
+    assert store.snapshots() == [first]
+
+
+def test_pruning_keeps_objects_a_kept_snapshot_still_uses(tmp_path):
+    store = BackupStore(str(tmp_path))
+    # A, B, A again: the old A and B are pruned, but A's object is shared
+    # with the kept snapshot.
+    a = '0 5 * * * a.ksh\n'
+    b = '0 6 * * * b.ksh\n'
+    old_a, created = store.snapshot(a, now=epoch(200, 9))
+    old_b, created = store.snapshot(b, now=epoch(200, 17))
+    store.jobs(old_a.digest)
+    store.jobs(old_b.digest)
+    new_a, created = store.snapshot(a, now=epoch(0))
+
+    assert store.snapshots() == [old_b, new_a]
+    store.snapshot('0 7 * * * c.ksh\n', now=epoch(0, 13))
+    # The old b is the last of its month, so stays; the first a went.
+    assert [s.time for s in store.snapshots()] == [old_b.time, new_a.time, epoch(0, 13)]
+    assert os.path.exists(store.object_path(old_a.digest))
+    assert store.read(new_a.digest) == a
+    assert list(store.jobs(new_a.digest).values()) == ['0 5 * * * a.ksh']
+
+
+def test_pruning_removes_objects_no_snapshot_uses(tmp_path):
+    store = BackupStore(str(tmp_path))
+    gone, created = store.snapshot('0 5 * * * a.ksh\n', now=epoch(200, 9))
+    store.jobs(gone.digest)
+    kept, created = store.snapshot('0 6 * * * b.ksh\n', now=epoch(200, 17))
+    store.snapshot('0 7 * * * c.ksh\n', now=epoch(0))
+
+    assert gone not in store.snapshots()
+    assert kept in store.snapshots()
+    assert not os.path.exists(store.object_path(gone.digest))
+    assert not os.path.exists(os.path.join(store.objects, gone.digest + '.jobs'))
+    assert os.path.exists(store.object_path(kept.digest))
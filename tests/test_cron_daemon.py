@@ -0,0 +1,134 @@
+import contextlib
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import cron_backup
+import cron_daemon
+from cron_jobs import parse_crontab
+
+BASE = '# ====== one\n0 1 * * * /bin/one.ksh\n'
+
+
+class FakeCrontab(object):
+    # Stands in for crontab(1), counting installs.
+
+    def __init__(self, text='', delay=0):
+        self.text = text
+        self.delay = delay
+        self.installs = 0
+
+    def read(self, user=None):
+        return self.text
+
+    def install(self, text, user=None):
+        time.sleep(self.delay)
+        self.text = text
+        self.installs += 1
+
+
+@pytest.fixture
+def crontab(monkeypatch):
+    fake = FakeCrontab(BASE)
+    monkeypatch.setattr(cron_backup, 'current_crontab', fake.read)
+    monkeypatch.setattr(cron_backup, 'install_crontab', fake.install)
+    monkeypatch.setattr(cron_daemon, 'locked', lambda *args: contextlib.nullcontext())
+    return fake
+
+
+def add(title, schedule='0 2 * * *'):
+    return {'op': 'add', 'jobs': [{'title': title, 'schedule': schedule, 'command': '/bin/' + title + '.ksh'}]}
+
+
+def titles(text):
+    return [entry.title for entry in parse_crontab(text)]
+
+
+def test_apply_writes_a_batch_once_and_answers_each_request(crontab):
+    service = cron_daemon.CrontabDaemon('testuser')
+    batch = [(add('two'), Future()), (add('one'), Future()), (add('three'), Future())]
+    service.apply(batch)
+    assert [future.result(0) for request, future in batch] == [
+        {'ok': True}, {'ok': False, 'error': 'a job titled "one" already exists'}, {'ok': True}]
+    assert crontab.installs == 1
+    assert titles(crontab.text) == ['one', 'two', 'three']
+
+
+def test_apply_writes_nothing_when_every_request_fails(crontab):
+    service = cron_daemon.CrontabDaemon('testuser')
+    future = Future()
+    service.apply([({'op': 'remove', 'title': 'nope'}, future)])
+    assert not future.result(0)['ok']
+    assert crontab.installs == 0
+
+
+@pytest.mark.parametrize('request_', [
+    {'op': 'add', 'jobs': 'x'},
+    {'op': 'add', 'jobs': []},
+    {'op': 'add', 'jobs': [None]},
+    {'op': 'add', 'jobs': [{'title': 'a', 'schedule': '* * * * *'}]},
+    {'op': 'remove'},
+    {'op': 'retime', 'title': 'one'},
+])
+def test_malformed_edits_are_refused_before_the_writer(crontab, request_):
+    service = cron_daemon.CrontabDaemon('testuser')
+    with pytest.raises(ValueError):
+        service.handle(request_)
+    assert service.queue.empty()
+
+
+def test_writer_survives_an_edit_that_raises(crontab):
+    service = cron_daemon.CrontabDaemon('testuser')
+    threading.Thread(target=service.writer, daemon=True).start()
+    # Straight onto the queue, as if it got past check_request().
+    broken = Future()
+    service.queue.put(({'op': 'add', 'jobs': [None]}, broken))
+    assert not broken.result(5)['ok']
+    assert service.handle(add('two')) == {'ok': True}
+    assert titles(crontab.text) == ['one', 'two']
+
+
+def test_requests_for_another_user_are_refused(crontab):
+    service = cron_daemon.CrontabDaemon('testuser')
+    assert not service.handle(dict(add('two'), user='someone'))['ok']
+    assert service.handle({'op': 'ping'})['user'] == 'testuser'
+
+
+def test_concurrent_clients_are_all_applied_in_few_writes(crontab, tmp_path):
+    crontab.delay = 0.05
+    service = cron_daemon.CrontabDaemon('testuser')
+    threading.Thread(target=service.writer, daemon=True).start()
+    path = str(tmp_path / 'daemon.sock')
+    server = cron_daemon.Server(path, cron_daemon.Handler)
+    server.service = service
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        assert cron_daemon.running(path)
+        clients = 30
+        results = [None] * clients
+
+        def client(n):
+            results[n] = cron_daemon.call(add('job ' + str(n)), path, timeout=30)
+        threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert results == [{'ok': True}] * clients
+    assert sorted(titles(crontab.text)) == sorted(['one'] + ['job ' + str(n) for n in range(clients)])
+    # Edits that arrive during a write go out together in the next one.
+    assert crontab.installs == service.writes < clients
+
+
+def test_running_is_false_without_a_daemon(tmp_path):
+    assert not cron_daemon.running(str(tmp_path / 'none.sock'))
+
+
+def test_socket_is_named_after_the_crontab_user():
+    assert cron_daemon.socket_path('rbm') == cron_daemon.SHARED_DIR + '/daemon.rbm.sock'
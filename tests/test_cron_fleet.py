@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+import cron_env
+import cron_fleet
+from cron_jobs import parse_crontab
+from cron_manifest import validate_rows
+
+RUNNER = '/usr/bin/python3 /opt/cron_automation/cron_runner.py'
+USERS = ('rbm', 'billops')
+
+
+@pytest.fixture(autouse=True)
+def users(monkeypatch):
+    # Every host resolves without billing, except "nobilling".
+    def resolve_users(hostname):
+        if hostname == 'nobilling':
+            raise KeyError(hostname)
+        return USERS
+    monkeypatch.setattr(cron_env, 'resolve_users', resolve_users)
+
+
+def rows(*specs):
+    valid, errors = validate_rows([dict(zip(('title', 'directory', 'ksh', 'schedule', 'overlap'), spec))
+                                   for spec in specs])
+    assert not errors
+    return valid
+
+
+def titles(transport, host):
+    return [entry.title for entry in parse_crontab(transport.read(host, 'rbm'))]
+
+
+def test_each_host_gets_the_jobs_it_does_not_have(tmp_path):
+    transport = cron_fleet.LocalTransport(str(tmp_path))
+    transport.write('app2t', 'rbm', '# ====== one\n0 1 * * * /bin/one.ksh\n')
+    valid = rows(('one', 'd', 'one', '0 1 * * *', ''), ('two', 'd', 'two', '0 2 * * *', ''))
+
+    results = cron_fleet.apply_fleet(transport, ['app1t', 'app2t'], valid)
+    assert [(r.host, r.added, r.existing, r.error) for r in results] == [
+        ('app1t', ['====== one', '====== two'], [], None),
+        ('app2t', ['====== two'], ['====== one'], None),
+    ]
+    assert titles(transport, 'app1t') == ['one', 'two']
+    assert titles(transport, 'app2t') == ['one', 'two']
+    # What was there before the write is kept on the host.
+    backups = os.listdir(str(tmp_path / 'app2t' / cron_fleet.REMOTE_BACKUP_DIR))
+    assert len(backups) == 1 and backups[0].startswith('rbm.crontab.')
+
+
+def test_dry_run_writes_nothing(tmp_path):
+    transport = cron_fleet.LocalTransport(str(tmp_path))
+    results = cron_fleet.apply_fleet(transport, ['app1t'], rows(('one', 'd', 'one', '0 1 * * *', '')), dry_run=True)
+    assert results[0].added == ['====== one']
+    assert not os.path.exists(transport.path('app1t', 'rbm'))
+
+
+def test_invalid_hosts_and_failed_lookups_fail_alone(tmp_path):
+    transport = cron_fleet.LocalTransport(str(tmp_path))
+    results = cron_fleet.apply_fleet(transport, ['-oProxyCommand=x', 'nobilling', 'app1t'],
+                                     rows(('one', 'd', 'one', '0 1 * * *', '')))
+    assert results[0].error == 'invalid host name'
+    assert results[1].error.startswith('could not resolve users')
+    assert results[2].error is None and results[2].added == ['====== one']
+
+
+def test_host_errors_go_in_the_result(tmp_path):
+    class Unreachable(cron_fleet.LocalTransport):
+        def read(self, host, user):
+            raise OSError('ssh: connect to host ' + host + ': Connection refused')
+
+    valid = rows(('one', 'd', 'one', '0 1 * * *', ''))
+    results = cron_fleet.apply_fleet(Unreachable(str(tmp_path)), ['app1t'], valid)
+    assert results[0].error == 'ssh: connect to host app1t: Connection refused'
+
+
+def test_a_crontab_changed_since_the_first_read_is_not_overwritten(tmp_path):
+    class Racy(cron_fleet.LocalTransport):
+        # Someone adds "two" and "three" between our two reads.
+        reads = 0
+
+        def read(self, host, user):
+            self.reads += 1
+            if self.reads == 2:
+                self.write(host, user, '# ====== two\n0 9 * * * /bin/theirs.ksh\n'
+                                       '# ====== three\n0 3 * * * /bin/3.ksh\n')
+            return cron_fleet.LocalTransport.read(self, host, user)
+
+    transport = Racy(str(tmp_path))
+    valid = rows(('one', 'd', 'one', '0 1 * * *', ''), ('two', 'd', 'two', '0 2 * * *', ''))
+    result = cron_fleet.apply_fleet(transport, ['app1t'], valid)[0]
+    assert (result.added, result.existing, result.error) == (['====== one'], ['====== two'], None)
+    text = transport.read('app1t', 'rbm')
+    assert [entry.title for entry in parse_crontab(text)] == ['two', 'three', 'one']
+    assert '/bin/theirs.ksh' in text
+    # The crontab that was replaced, with their jobs, is kept on the host.
+    backups = str(tmp_path / 'app1t' / cron_fleet.REMOTE_BACKUP_DIR)
+    assert any('/bin/theirs.ksh' in open(os.path.join(backups, name)).read() for name in os.listdir(backups))
+
+
+def test_runner_is_required_for_overlap_and_record_runs(tmp_path):
+    transport = cron_fleet.LocalTransport(str(tmp_path))
+    plain = rows(('one', 'd', 'one', '0 1 * * *', ''))
+    single = rows(('one', 'd', 'one', '*/5 * * * *', 'skip'))
+    with pytest.raises(ValueError):
+        cron_fleet.apply_fleet(transport, ['app1t'], single)
+    with pytest.raises(ValueError):
+        cron_fleet.apply_fleet(transport, ['app1t'], plain, record_runs=True)
+
+    cron_fleet.apply_fleet(transport, ['app1t'], single, runner=RUNNER)
+    command = RUNNER + ' --single-instance skip /usr/local/rbm/home_dirs/billops/bin/d/one.ksh'
+    assert command in transport.read('app1t', 'rbm')
@@ -0,0 +1,117 @@
+import datetime
+
+import pytest
+
+from cron_schedule import Schedule, parse_field
+
+MINUTE, HOUR, DOM, MONTH, DOW = range(5)
+
+
+def values(bits):
+    return [n for n in range(64) if bits >> n & 1]
+
+
+def test_parse_field_lists_ranges_and_steps():
+    assert values(parse_field('5', MINUTE)) == [5]
+    assert values(parse_field('1,3,5', HOUR)) == [1, 3, 5]
+    assert values(parse_field('9-12', HOUR)) == [9, 10, 11, 12]
+    assert values(parse_field('*/15', MINUTE)) == [0, 15, 30, 45]
+    assert values(parse_field('10-20/5', MINUTE)) == [10, 15, 20]
+    # A single value with a step runs to the end of the range.
+    assert values(parse_field('50/5', MINUTE)) == [50, 55]
+    assert values(parse_field('*', DOM)) == list(range(1, 32))
+
+
+def test_parse_field_names():
+    assert values(parse_field('jan,Mar', MONTH)) == [1, 3]
+    assert values(parse_field('jun-aug', MONTH)) == [6, 7, 8]
+    assert values(parse_field('mon-fri', DOW)) == [1, 2, 3, 4, 5]
+    assert values(parse_field('SUN', DOW)) == [0]
+
+
+def test_parse_field_dow_7_is_sunday():
+    assert values(parse_field('7', DOW)) == [0]
+    assert values(parse_field('5-7', DOW)) == [0, 5, 6]
+    assert values(parse_field('*', DOW)) == list(range(7))
+
+
+@pytest.mark.parametrize('text, field', [
+    ('60', MINUTE),
+    ('24', HOUR),
+    ('0', DOM),
+    ('13', MONTH),
+    ('8', DOW),
+    ('5-1', HOUR),
+    ('*/0', MINUTE),
+    ('x', MINUTE),
+])
+def test_parse_field_rejects(text, field):
+    with pytest.raises(ValueError):
+        parse_field(text, field)
+
+
+def test_schedule_needs_five_fields():
+    with pytest.raises(ValueError):
+        Schedule('0 5 * *')
+
+
+# 2024-03-01 is a Friday, 2024-03-04 a Monday and 2024-03-15 a Friday.
+FRI_1 = datetime.date(2024, 3, 1)
+MON_4 = datetime.date(2024, 3, 4)
+FRI_15 = datetime.date(2024, 3, 15)
+TUE_5 = datetime.date(2024, 3, 5)
+
+
+def test_day_matches_either_day_field_when_both_are_set():
+    schedule = Schedule('0 0 15 * 1')
+    assert schedule.day_or
+    assert schedule.day_matches(MON_4)
+    assert schedule.day_matches(FRI_15)
+    assert not schedule.day_matches(TUE_5)
+
+
+def test_day_matches_both_when_one_day_field_is_a_star():
+    schedule = Schedule('0 0 * * 5')
+    assert not schedule.day_or
+    assert schedule.day_matches(FRI_1)
+    assert not schedule.day_matches(MON_4)
+
+    schedule = Schedule('0 0 1 * *')
+    assert schedule.day_matches(FRI_1)
+    assert not schedule.day_matches(FRI_15)
+
+
+def test_day_matches_a_stepped_star_counts_as_a_star():
+    # As in Vixie cron, "*/2" starts with "*", so the day fields are ANDed:
+    # odd days of the month that are also Fridays.
+    schedule = Schedule('0 0 */2 * 5')
+    assert not schedule.day_or
+    assert schedule.day_matches(FRI_1)
+    assert schedule.day_matches(FRI_15)
+    assert not schedule.day_matches(datetime.date(2024, 3, 8))
+    assert not schedule.day_matches(datetime.date(2024, 3, 3))
+
+
+def test_day_matches_month_and_dow_7():
+    schedule = Schedule('0 0 * mar 7')
+    assert schedule.day_matches(datetime.date(2024, 3, 3))
+    assert not schedule.day_matches(datetime.date(2024, 4, 7))
+
+
+def test_specials_and_reboot():
+    assert Schedule('@daily').day_minutes == [0]
+    assert Schedule('@weekly').day_matches(datetime.date(2024, 3, 3))
+    reboot = Schedule('@reboot')
+    assert reboot.never
+    assert not reboot.day_matches(datetime.date(2024, 1, 1))
+    assert reboot.next_runs(1) == []
+
+
+def test_next_runs():
+    after = datetime.datetime(2024, 3, 1, 12, 0)
+    assert Schedule('30 9,17 * * 1-5').next_runs(3, after) == [
+        datetime.datetime(2024, 3, 1, 17, 30),
+        datetime.datetime(2024, 3, 4, 9, 30),
+        datetime.datetime(2024, 3, 4, 17, 30),
+    ]
+    assert Schedule('0 0 30 2 *').next_runs(1, after) == []
@@ -0,0 +1,138 @@
+import builtins
+import io
+
+import pytest
+
+from cron_walkthrough import AnswerSource, Walkthrough, WalkthroughError
+
+JOB = ['my job', 'dir1', 'run.ksh']
+
+
+def replay(*answers, titles=()):
+    # (JobAnswers of the first job, what was printed) for a replay.
+    output = []
+    source = AnswerSource(io.StringIO(''.join(answer + '\n' for answer in answers)))
+    walkthrough = Walkthrough(source, output.append, titles)
+    return walkthrough.run(), output
+
+
+def walk(*answers):
+    answers, output = replay(*(JOB + ['w'] + list(answers)))
+    return answers
+
+
+def test_every_field_every():
+    answers = walk('y', 'y', 'y', 'y', 'y')
+    assert answers.schedule == '* * * * *'
+    assert (answers.title, answers.directory, answers.ksh) == ('my job', 'dir1', 'run.ksh')
+    assert answers.answers == JOB + ['w', 'y', 'y', 'y', 'y', 'y']
+    assert answers.overlap is None
+
+
+def test_one_value_of_each_field():
+    # minute, hour, day of week, then "only per week?" no, day of month, month.
+    answers = walk('n', 'y', '30', 'n', 'y', '5', 'n', 'y', '1', 'n', 'y', '15', 'n', 'y', '6')
+    assert answers.schedule == '30 5 15 6 1'
+
+
+def test_intervals_and_lists_ask_about_overlap():
+    answers = walk('n', 'n', 'i', '15', 'n', 'n', 's', '1,2,3', 'n', 'n', 's', '1,5', 'y', 'n', 'n', 'i', '2', 's')
+    assert answers.schedule == '*/15 1,2,3 * */2 1,5'
+    assert answers.overlap == 'skip'
+    assert answers.answers[-1] == 's'
+
+
+def test_no_overlap_question_without_an_interval():
+    answers = walk('n', 'n', 's', '0,30', 'y', 'y', 'y', 'y')
+    assert answers.schedule == '0,30 * * * *'
+    assert answers.answers[-1] == 'y'
+
+
+def test_restart_starts_the_schedule_over_and_is_not_recorded():
+    answers = walk('n', 'y', '30', 'n', 'restart', 'n', 'y', '10', 'y', 'y', 'y', 'y')
+    assert answers.schedule == '10 * * * *'
+    assert answers.answers == JOB + ['w', 'n', 'y', '10', 'y', 'y', 'y', 'y']
+
+
+@pytest.mark.parametrize('answers, line', [
+    (JOB + ['w', 'n', 'y', '60'], 7),
+    (JOB + ['w', 'maybe'], 5),
+    (JOB + ['x'], 4),
+    (JOB + ['c', '61 * * * *'], 5),
+    (['', 'dir1'], 1),
+    (['my job', 'dir 1'], 2),
+])
+def test_a_bad_answer_stops_a_replay_naming_its_line(answers, line):
+    with pytest.raises(WalkthroughError) as raised:
+        replay(*answers)
+    assert 'line ' + str(line) + ':' in str(raised.value)
+
+
+def test_a_replay_ending_in_the_middle_of_a_job():
+    with pytest.raises(WalkthroughError):
+        replay(*(JOB + ['w', 'y']))
+
+
+def test_an_empty_replay_has_no_job():
+    assert replay()[0] is None
+
+
+def test_an_existing_title_is_refused():
+    with pytest.raises(WalkthroughError):
+        replay(*(JOB + ['c', '0 5 * * *']), titles=['====== my job'])
+
+
+def test_a_bad_answer_typed_in_is_asked_again(monkeypatch):
+    typed = iter(JOB + ['w', 'n', 'y', '75', '15', 'y', 'y', 'y', 'y'])
+    monkeypatch.setattr(builtins, 'input', lambda: next(typed))
+    output = []
+    answers = Walkthrough(AnswerSource(), output.append).run()
+    assert answers.schedule == '15 * * * *'
+    assert '75' not in answers.answers
+    assert 'Expected a number from 0 to 59, or [restart].' in output
+
+
+def test_auto_minute_and_hour():
+    answers = walk('n', 'y', 'auto', 'n', 'y', 'auto', 'y', 'y', 'y')
+    assert (answers.auto_minute, answers.auto_hour) == (True, True)
+    assert answers.schedule == '0 0 * * *'
+
+
+def test_auto_hour_needs_auto_minute():
+    with pytest.raises(WalkthroughError):
+        walk('n', 'y', '5', 'n', 'y', 'auto')
+
+
+@pytest.mark.parametrize('schedule', ['@daily', '@hourly', '@weekly', '@reboot', '0 5 * * 1-5'])
+def test_cron_mode_keeps_the_schedule_whole(schedule):
+    answers, output = replay(*(JOB + ['c', schedule]))
+    assert answers.schedule == schedule
+    assert answers.overlap is None
+    assert answers.answers == JOB + ['c', schedule]
+
+
+def test_cron_mode_interval_asks_about_overlap():
+    answers, output = replay(*(JOB + ['c', '*/5  * * * *', 'k']))
+    assert answers.schedule == '*/5 * * * *'
+    assert answers.overlap == 'kill'
+
+
+def test_cron_mode_restart_goes_back_to_the_mode_question():
+    answers, output = replay(*(JOB + ['c', 'restart', 'w', 'y', 'y', 'y', 'y', 'y']))
+    assert answers.schedule == '* * * * *'
+    assert answers.answers == JOB + ['w', 'y', 'y', 'y', 'y', 'y']
+
+
+def test_recorded_answers_replay_to_the_same_job():
+    first = walk('n', 'n', 'i', '15', 'n', 'y', '3', 'y', 'y', 'y', 'q')
+    again, output = replay(*first.answers)
+    assert again == first
+
+
+def test_several_jobs_in_one_replay():
+    answers = ['one', 'dir1', 'a', 'c', '@daily', 'two', 'dir1', 'b', 'c', '0 5 * * *']
+    source = AnswerSource(io.StringIO(''.join(answer + '\n' for answer in answers)))
+    walkthrough = Walkthrough(source, [].append)
+    jobs = [walkthrough.run(), walkthrough.run(), walkthrough.run()]
+    assert [job.title for job in jobs[:2]] == ['one', 'two']
+    assert jobs[2] is None